@@ -17,6 +17,7 @@ setup(
     author_email="robertlechte@gmail.com",
     install_requires=[
         "pathlib; python_version<'3'",
+        "futures; python_version<'3'",
         "six",
         "sqlalchemy"],
     zip_safe=False,
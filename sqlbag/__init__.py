@@ -4,52 +4,126 @@
 This is a whole bunch of useful boilerplate and helper methods, for working
 with SQL databases, particularly PostgreSQL.
 
+Submodules are imported the first time one of their names is used, so
+`import sqlbag` itself is cheap, and using :func:`S` doesn't pay for
+importing psycopg2, pendulum and friends.
+
 """
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from .misc import (
-    quoted_identifier,
-    load_sql_from_folder,
-    load_sql_from_file,
-    sql_from_file,
-    sql_from_folder,
-    sql_from_folder_iter,
-)  # noqa
-
-from .sqla import (
-    S,
-    raw_execute,
-    admin_db_connection,
-    _killquery,
-    kill_other_connections,
-    session,
-    DB_ERROR_TUPLE,
-    raw_connection,
-    get_raw_autocommit_connection,
-    copy_url,
-    alter_url,
-    connection_from_s_or_c,
-    C,
-)  # noqa
-
-from .sqla_orm import (
-    row2dict,
-    Base,
-    metadata_from_session,
-    sqlachanges,
-    get_properties,
-)  # noqa
-
-from .createdrop import (
-    database_exists,
-    create_database,
-    drop_database,
-    temporary_database,
-    can_select,
-)  # noqa
-
-try:
-    from . import pg
-except ImportError:
-    pg = None
+import importlib
+import sys
+
+_EXPORTS = {
+    ".misc": [
+        "quoted_identifier",
+        "load_sql_from_folder",
+        "load_sql_from_file",
+        "sql_from_file",
+        "sql_from_folder",
+        "sql_from_folder_iter",
+    ],
+    ".sqla": [
+        "S",
+        "raw_execute",
+        "stream_query",
+        "execute_batch",
+        "admin_db_connection",
+        "AdminConnections",
+        "active_admin_connections",
+        "_killquery",
+        "kill_other_connections",
+        "session",
+        "configure_session_cache",
+        "DB_ERROR_TUPLE",
+        "raw_connection",
+        "get_raw_autocommit_connection",
+        "autocommit_connection",
+        "copy_url",
+        "alter_url",
+        "connection_from_s_or_c",
+        "C",
+        "get_engine",
+    ],
+    ".sqla_orm": [
+        "row2dict",
+        "Base",
+        "metadata_from_session",
+        "sqlachanges",
+        "get_properties",
+    ],
+    ".createdrop": [
+        "database_exists",
+        "create_database",
+        "drop_database",
+        "create_databases",
+        "drop_databases",
+        "snapshot_database",
+        "restore_database",
+        "collect_temporary_databases",
+        "temporary_database",
+        "can_select",
+    ],
+    ".dbpool": ["TemporaryDatabasePool"],
+    ".fanout": ["fan_out", "FanOutResult"],
+    ".sqla_async": [
+        "AS",
+        "AC",
+        "async_session",
+        "async_raw_execute",
+        "get_async_engine",
+    ],
+}
+
+# these may be missing dependencies (or, for asyncio, python 3)
+_OPTIONAL = (".sqla_async",)
+
+_LAZY_NAMES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = [
+    name
+    for name, module in _LAZY_NAMES.items()
+    if not name.startswith("_") and module not in _OPTIONAL
+] + ["pg"]
+
+
+def _load(name):
+    if name == "pg":
+        try:
+            value = importlib.import_module(".pg", __name__)
+        except ImportError:
+            value = None
+    else:
+        module = _LAZY_NAMES[name]
+
+        try:
+            value = getattr(importlib.import_module(module, __name__), name)
+        except (ImportError, SyntaxError):
+            if module not in _OPTIONAL:
+                raise
+            raise AttributeError(
+                "{} requires {}, which couldn't be imported".format(name, module)
+            )
+
+    globals()[name] = value
+    return value
+
+
+def __getattr__(name):
+    if name == "pg" or name in _LAZY_NAMES:
+        return _load(name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES) | {"pg"})
+
+
+if sys.version_info < (3, 7):  # pragma: no cover
+    # no module __getattr__ (PEP 562), so import everything up front
+    for _name in list(_LAZY_NAMES) + ["pg"]:
+        try:
+            _load(_name)
+        except AttributeError:
+            pass
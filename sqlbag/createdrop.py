@@ -4,17 +4,26 @@ import copy
 import getpass
 import os
 import random
+import sqlite3
 import string
 import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import bindparam, text
 from sqlalchemy.exc import InternalError, OperationalError, ProgrammingError
 
 from sqlbag import quoted_identifier
 
 from .sqla import (
+    _admin_engine,
+    _create_engine,
+    _dispose_cached_engines,
+    _admin_url,
+    active_admin_connections,
     admin_db_connection,
+    alter_url,
     connection_from_s_or_c,
     make_url,
     kill_other_connections,
@@ -38,7 +47,7 @@ def database_exists(db_url, test_can_select=False):
 def can_select(url):
     text = "select 1"
 
-    e = create_engine(url)
+    e = _create_engine(url)
 
     try:
         e.execute(text)
@@ -75,6 +84,43 @@ def _database_exists(session_or_connection, name):
         return bool(result)
 
 
+def _create_database(c, name, template=None):
+    if template:
+        t = "template {}".format(quoted_identifier(template))
+    else:
+        t = ""
+
+    c.execute(
+        """
+        create database {} {};
+    """.format(
+            quoted_identifier(name), t
+        )
+    )
+
+
+def _drop_database(c, name):
+    dbtype = c.engine.dialect.name
+
+    if dbtype == "postgresql":
+
+        REVOKE = "revoke connect on database {} from public"
+        revoke = REVOKE.format(quoted_identifier(name))
+        c.execute(revoke)
+
+    kill_other_connections(c, name, hardkill=True)
+
+    c.execute(
+        """
+        drop database if exists {};
+    """.format(
+            quoted_identifier(name)
+        )
+    )
+
+    _dispose_cached_engines(alter_url(c.engine.url, database=name))
+
+
 def create_database(db_url, template=None, wipe_if_existing=False):
     target_url = make_url(db_url)
     dbtype = target_url.get_dialect().name
@@ -91,18 +137,7 @@ def create_database(db_url, template=None, wipe_if_existing=False):
             return True
 
         with admin_db_connection(target_url) as c:
-            if template:
-                t = "template {}".format(quoted_identifier(template))
-            else:
-                t = ""
-
-            c.execute(
-                """
-                create database {} {};
-            """.format(
-                    quoted_identifier(target_url.database), t
-                )
-            )
+            _create_database(c, target_url.database, template)
         return True
 
 
@@ -121,24 +156,324 @@ def drop_database(db_url):
                 return False
         else:
             with admin_db_connection(url) as c:
-                if dbtype == "postgresql":
+                _drop_database(c, name)
+            return True
+    else:
+        return False
+
+
+DATABASE_OWNER = """
+    SELECT pg_get_userbyid(datdba) AS owner, datacl IS NULL AS default_acl
+    FROM pg_catalog.pg_database
+    WHERE datname = :name
+"""
+
+DATABASE_GRANTS = """
+    SELECT
+        CASE
+            WHEN a.grantee = 0 THEN NULL
+            ELSE pg_get_userbyid(a.grantee)
+        END AS grantee,
+        a.privilege_type,
+        a.is_grantable
+    FROM pg_catalog.pg_database d, aclexplode(d.datacl) a
+    WHERE d.datname = :name
+"""
+
+
+def _database_access(c, name):
+    row = c.execute(text(DATABASE_OWNER), name=name).first()
+
+    if row is None:
+        return None
+
+    if row.default_acl:
+        grants = None
+    else:
+        grants = list(c.execute(text(DATABASE_GRANTS), name=name))
+    return row.owner, grants
+
+
+def _restore_access(c, name, access):
+    # create database (and rename) leave the database owned by us, with the
+    # default privileges
+    owner, grants = access
+    name = quoted_identifier(name)
+
+    c.execute("alter database {} owner to {}".format(name, quoted_identifier(owner)))
+
+    if grants is None:
+        return
+
+    c.execute(
+        "revoke all on database {} from public, {}".format(
+            name, quoted_identifier(owner)
+        )
+    )
+
+    for grantee, privilege, grantable in grants:
+        c.execute(
+            "grant {} on database {} to {}{}".format(
+                privilege,
+                name,
+                "public" if grantee is None else quoted_identifier(grantee),
+                " with grant option" if grantable else "",
+            )
+        )
+
+
+def _existing_databases(c, names):
+    dbtype = c.engine.dialect.name
 
-                    REVOKE = "revoke connect on database {} from public"
-                    revoke = REVOKE.format(quoted_identifier(name))
-                    c.execute(revoke)
+    if dbtype == "postgresql":
+        EXISTENCE = """
+            SELECT datname
+            FROM pg_catalog.pg_database
+            WHERE datname IN :names
+        """
+    elif dbtype == "mysql":
+        EXISTENCE = """
+            SELECT SCHEMA_NAME
+            FROM INFORMATION_SCHEMA.SCHEMATA
+            WHERE SCHEMA_NAME IN :names
+        """
+    else:
+        raise NotImplementedError
+
+    q = text(EXISTENCE).bindparams(bindparam("names", expanding=True))
+    return set(row[0] for row in c.execute(q, names=list(names)))
+
+
+def _bulk_createdrop(db_urls, max_workers, create, template=None):
+    results = OrderedDict((u, None) for u in db_urls)
+    by_server = OrderedDict()
+
+    for u in db_urls:
+        url = make_url(u)
+
+        if url.get_dialect().name == "sqlite":
+            try:
+                if create:
+                    results[u] = create_database(url, template=template)
+                else:
+                    results[u] = drop_database(url)
+            except Exception as e:
+                results[u] = e
+        else:
+            server = _admin_url(url)
+            by_server.setdefault(server, []).append((u, url.database))
+
+    admin = active_admin_connections()
+
+    if admin:
+        # any more would only queue for the pool's connections, and time out
+        max_workers = min(max_workers, admin.pool_size)
+
+    for server, targets in by_server.items():
+        if admin:
+            e = admin.engine(server)
+        else:
+            e = _admin_engine(server, pool_size=max_workers)
+
+        try:
+            with e.connect() as c:
+                existing = _existing_databases(c, [name for _, name in targets])
+
+            def run(name):
+                with e.connect() as c:
+                    if create:
+                        _create_database(c, name, template)
+                    else:
+                        _drop_database(c, name)
+
+            todo = []
+
+            for u, name in targets:
+                if (name in existing) == create:
+                    results[u] = False
+                else:
+                    todo.append((u, name))
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [(u, executor.submit(run, name)) for u, name in todo]
+
+                for u, f in futures:
+                    exc = f.exception()
+                    results[u] = exc if exc else True
+        finally:
+            if not admin:
+                e.dispose()
+
+    return results
+
+
+def create_databases(db_urls, template=None, max_workers=4):
+    """
+    Args:
+        db_urls: URLs of the databases to create.
+        template(str): Name of the template database to create them from (PostgreSQL only).
+        max_workers(int): Maximum number of databases to create at once on each server. Within :class:`AdminConnections`, no more than its `pool_size`.
+
+    Returns:
+        results (OrderedDict): Maps each URL to True if it was created, False if it already existed, or the exception raised trying to create it.
+
+    Create many databases at once. Databases on the same server share a small pool of admin connections, are checked for existence with a single query, and are created concurrently.
+    """
+    return _bulk_createdrop(db_urls, max_workers, create=True, template=template)
+
+
+def drop_databases(db_urls, max_workers=4):
+    """
+    Args:
+        db_urls: URLs of the databases to drop.
+        max_workers(int): Maximum number of databases to drop at once on each server.
+
+    Returns:
+        results (OrderedDict): Maps each URL to True if it was dropped, False if it didn't exist, or the exception raised trying to drop it.
+
+    Drop many databases at once, in the same way as :func:`create_databases`.
+    """
+    return _bulk_createdrop(db_urls, max_workers, create=False)
+
+
+def snapshot_database(db_url, snapshot_name=None):
+    """
+    Args:
+        db_url: URL of the database to snapshot.
+        snapshot_name(str): Name for the snapshot database. A random name is generated if not specified.
+
+    Returns:
+        snapshot_name (str): Name of the snapshot database.
+
+    Copy a PostgreSQL database, in its current state, to a snapshot database on the same server (using `create database ... template ...`). Any other connections to the database are killed first, as PostgreSQL requires. The snapshot gets the same owner and database-level privileges as the database.
+
+    Restore it with :func:`restore_database`.
+    """
+    url = make_url(db_url)
 
-                kill_other_connections(c, name, hardkill=True)
+    if url.get_dialect().name != "postgresql":
+        raise NotImplementedError("snapshots require postgresql")
 
-                c.execute(
-                    """
-                    drop database if exists {};
-                """.format(
-                        quoted_identifier(name)
-                    )
+    snapshot_name = snapshot_name or temporary_name(prefix="sqlbag_snapshot_")
+
+    with admin_db_connection(url) as c:
+        access = _database_access(c, url.database)
+        kill_other_connections(c, url.database, hardkill=True)
+        _create_database(c, snapshot_name, template=url.database)
+        _restore_access(c, snapshot_name, access)
+
+    _dispose_cached_engines(url)
+    return snapshot_name
+
+
+def restore_database(db_url, snapshot_name, keep_snapshot=True):
+    """
+    Args:
+        db_url: URL of the database to restore.
+        snapshot_name(str): Name of a snapshot database created by :func:`snapshot_database`.
+        keep_snapshot(bool): If True, the database is recreated as a copy of the snapshot, so the snapshot can be restored again. If False, the snapshot is simply renamed, which is faster but uses it up.
+
+    Replace a PostgreSQL database with a snapshot of it. Other connections to the database (and snapshot) are killed first. The restored database keeps the owner and database-level privileges of the one it replaces (or of the snapshot, if the database is gone).
+    """
+    url = make_url(db_url)
+
+    if url.get_dialect().name != "postgresql":
+        raise NotImplementedError("snapshots require postgresql")
+
+    name = url.database
+
+    with admin_db_connection(url) as c:
+        access = _database_access(c, name) or _database_access(c, snapshot_name)
+        _drop_database(c, name)
+        kill_other_connections(c, snapshot_name, hardkill=True)
+
+        if keep_snapshot:
+            _create_database(c, name, template=snapshot_name)
+        else:
+            c.execute(
+                "alter database {} rename to {}".format(
+                    quoted_identifier(snapshot_name), quoted_identifier(name)
                 )
-            return True
+            )
+        _restore_access(c, name, access)
+
+    _dispose_cached_engines(url)
+
+
+def _temporary_database_names(c, prefix, older_than=None, owner=None):
+    dbtype = c.engine.dialect.name
+
+    params = dict(prefix=prefix)
+
+    if dbtype == "postgresql":
+        LIST = """
+            SELECT d.datname
+            FROM pg_catalog.pg_database d
+            WHERE left(d.datname, length(:prefix)) = :prefix
+        """
+
+        if owner:
+            LIST += " AND pg_get_userbyid(d.datdba) = :owner"
+            params["owner"] = owner
+
+        if older_than is not None:
+            # there's no creation timestamp for databases, so go by the
+            # files on disk (this needs superuser or pg_read_server_files)
+            LIST += """
+                AND now() - (
+                    pg_stat_file('base/' || d.oid || '/PG_VERSION')
+                ).modification > :older_than
+            """
+            params["older_than"] = older_than
+
+    elif dbtype == "mysql":
+        if owner or older_than is not None:
+            raise NotImplementedError("owner and age filters require postgresql")
+
+        LIST = """
+            SELECT SCHEMA_NAME
+            FROM INFORMATION_SCHEMA.SCHEMATA
+            WHERE LEFT(SCHEMA_NAME, CHAR_LENGTH(:prefix)) = :prefix
+        """
     else:
-        return False
+        raise NotImplementedError
+
+    return sorted(row[0] for row in c.execute(text(LIST), **params))
+
+
+def collect_temporary_databases(
+    db_url,
+    prefix="sqlbag_tmp_",
+    older_than=None,
+    owner=None,
+    max_workers=4,
+    dry_run=False,
+):
+    """
+    Args:
+        db_url: URL of any database on the server to clean up.
+        prefix(str): Only databases whose names start with this are dropped. Defaults to the prefix used by :func:`temporary_database`.
+        older_than(timedelta): Only drop databases at least this old (PostgreSQL only, and needs superuser or pg_read_server_files).
+        owner(str): Only drop databases owned by this user (PostgreSQL only).
+        max_workers(int): Maximum number of databases to drop at once.
+        dry_run(bool): Just report what would be dropped.
+
+    Returns:
+        results (OrderedDict): Maps the name of each matching database to True if it was dropped, False if it had already gone, the exception raised trying to drop it, or None in a dry run.
+
+    Drop temporary databases that have been left behind, for instance by test runs that crashed before they could clean up. Connections to them are killed first.
+    """
+    with admin_db_connection(db_url) as c:
+        names = _temporary_database_names(
+            c, prefix, older_than=older_than, owner=owner
+        )
+
+    if dry_run:
+        return OrderedDict((name, None) for name in names)
+
+    urls = [alter_url(db_url, database=name) for name in names]
+    results = drop_databases(urls, max_workers=max_workers)
+    return OrderedDict(zip(names, results.values()))
 
 
 def _current_username():
@@ -152,25 +487,111 @@ def temporary_name(prefix="sqlbag_tmp_"):
     return tempname
 
 
+def temporary_url(name, dialect="postgresql", host=None):
+    """
+    Args:
+        name(str): Name of the database.
+        dialect(str): Type of database (either 'postgresql' or 'mysql').
+        host(str): Host of the database server. Defaults to local.
+
+    Returns:
+        url (str): A URL for the named database, connecting as the current user.
+    """
+    host = host or ""
+
+    url = "{}://{}@{}/{}".format(dialect, _current_username(), host, name)
+
+    if url.startswith("mysql:"):
+        url = url.replace("mysql:", "mysql+pymysql:", 1)
+    return url
+
+
+def _sqlite_connect(db_url):
+    url = make_url(db_url)
+    query = dict(url.query)
+
+    uri = query.pop("uri", "false").lower() == "true"
+    filename = url.database or ":memory:"
+
+    if uri and query:
+        params = "&".join("{}={}".format(k, v) for k, v in sorted(query.items()))
+        filename += "?" + params
+    return sqlite3.connect(filename, uri=uri)
+
+
+def _sqlite_copy(source_url, dest):
+    source = _sqlite_connect(source_url)
+
+    try:
+        source.backup(dest)
+    finally:
+        source.close()
+
+
 @contextmanager
-def temporary_database(dialect="postgresql", do_not_delete=False, host=None):
+def temporary_database(
+    dialect="postgresql",
+    do_not_delete=False,
+    host=None,
+    template=None,
+    memory=False,
+    directory=None,
+):
     """
     Args:
         dialect(str): Type of database to create (either 'postgresql', 'mysql', or 'sqlite').
         do_not_delete: Do not delete the database as this method usually would.
+        template: Start from a copy of this database. For PostgreSQL, the name of a template database. For SQLite, the URL of a database to copy with the SQLite backup API.
+        memory: SQLite only. Use a shared-cache in-memory database instead of a file.
+        directory: SQLite only. Where to put the database file (a tmpfs path such as /dev/shm avoids disk I/O).
 
     Creates a temporary database for the duration of the context manager scope. Cleans it up when finished unless do_not_delete is specified.
 
     PostgreSQL, MySQL/MariaDB, and SQLite are supported. This method's mysql creation code uses the pymysql driver, so make sure you have that installed.
+
+    Seeding an in-memory SQLite database once, then using it as the template for a fresh in-memory copy per test, keeps the disk out of the test loop entirely:
+
+    .. code-block:: python
+
+        with temporary_database('sqlite', memory=True) as seeded:
+            load_fixtures(seeded)
+
+            with temporary_database('sqlite', memory=True, template=seeded) as url:
+                ...
+
+    An in-memory database only lasts as long as the context manager scope, regardless of do_not_delete.
     """
 
-    host = host or ""
+    if dialect == "sqlite" and memory:
+        url = "sqlite:///file:{}?mode=memory&cache=shared&uri=true".format(
+            temporary_name()
+        )
+
+        # the database exists only while at least one connection to it is open
+        keeper = _sqlite_connect(url)
+
+        try:
+            if template:
+                _sqlite_copy(template, keeper)
+            yield url
+
+        finally:
+            _dispose_cached_engines(url)
+            keeper.close()
 
-    if dialect == "sqlite":
-        tmp = tempfile.NamedTemporaryFile(delete=False)
+    elif dialect == "sqlite":
+        tmp = tempfile.NamedTemporaryFile(delete=False, dir=directory)
 
         try:
             url = "sqlite:///" + tmp.name
+
+            if template:
+                dest = _sqlite_connect(url)
+
+                try:
+                    _sqlite_copy(template, dest)
+                finally:
+                    dest.close()
             yield url
 
         finally:
@@ -180,15 +601,10 @@ def temporary_database(dialect="postgresql", do_not_delete=False, host=None):
     else:
         tempname = temporary_name()
 
-        current_username = _current_username()
-
-        url = "{}://{}@{}/{}".format(dialect, current_username, host, tempname)
-
-        if url.startswith("mysql:"):
-            url = url.replace("mysql:", "mysql+pymysql:", 1)
+        url = temporary_url(tempname, dialect=dialect, host=host)
 
         try:
-            create_database(url)
+            create_database(url, template=template)
             yield url
         finally:
             if not do_not_delete:
@@ -0,0 +1,280 @@
+"""A pool of ready-made temporary databases, cloned from a template."""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+from collections import deque
+from contextlib import contextmanager
+from timeit import default_timer
+
+from .createdrop import create_database, drop_database, temporary_name, temporary_url
+from .sqla import admin_db_connection, kill_other_connections
+
+
+class TemporaryDatabasePool(object):
+    """
+    Args:
+        setup: Callable taking the URL of the template database, which should load it with whatever every clone needs (run migrations, load fixtures, etc). Optional.
+        size(int): Number of clones to keep ready.
+        dialect(str): Type of database. Only 'postgresql' is supported, as clones are created with `create database ... template ...`.
+        host(str): Host of the database server. Defaults to local.
+        prefix(str): Name prefix for the template and its clones.
+
+    Keeps `size` clones of a template database ready in the background, so that handing one out costs nothing. Released clones are dropped in the background and replaced with fresh ones.
+
+    .. code-block:: python
+
+        with TemporaryDatabasePool(setup=migrate, size=4) as pool:
+            with pool.database() as url:
+                with S(url) as s:
+                    s.execute('select 1')
+
+    Call `stats()` to see how often a clone was ready when asked for, and how long callers waited when one wasn't.
+    """
+
+    def __init__(
+        self, setup=None, size=2, dialect="postgresql", host=None, prefix="sqlbag_tmp_"
+    ):
+        if dialect != "postgresql":
+            raise NotImplementedError("template cloning requires postgresql")
+
+        self.setup = setup
+        self.size = size
+        self.dialect = dialect
+        self.host = host
+        self.prefix = prefix
+
+        self.template_name = None
+        self.template_url = None
+
+        self._ready = deque()
+        self._to_drop = deque()
+        self._out = set()
+        self._error = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._starting = threading.Lock()
+        self._worker = None
+
+        self.hits = 0
+        self.misses = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.created = 0
+        self.dropped = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        """
+        Create and set up the template database, then start filling the pool in a background thread. Called automatically on first use.
+
+        If setup fails, the template is dropped again and the error raised.
+        """
+        # setup can take a while, so it's serialized with its own lock rather
+        # than holding up stats() and everything else that uses the condition
+        with self._starting:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("pool is closed")
+                if self._worker:
+                    return
+
+            template_name = temporary_name(self.prefix)
+            template_url = temporary_url(
+                template_name, dialect=self.dialect, host=self.host
+            )
+
+            create_database(template_url)
+
+            try:
+                if self.setup:
+                    self.setup(template_url)
+
+                # postgres refuses to clone a database that has open
+                # connections, including any left idle in a pool by the setup
+                with admin_db_connection(template_url) as c:
+                    kill_other_connections(c, template_name, hardkill=True)
+            except Exception:
+                drop_database(template_url)
+                raise
+
+            with self._cond:
+                if self._closed:
+                    drop_database(template_url)
+                    raise RuntimeError("pool is closed")
+
+                self.template_name = template_name
+                self.template_url = template_url
+
+                self._worker = threading.Thread(target=self._work)
+                self._worker.daemon = True
+                self._worker.start()
+
+    def _next_task(self):
+        with self._cond:
+            while True:
+                need_more = not self._closed and len(self._ready) < self.size
+
+                if need_more and not (self._to_drop and self._ready):
+                    url = temporary_url(
+                        temporary_name(self.prefix), dialect=self.dialect, host=self.host
+                    )
+                    return "create", url
+                if self._to_drop:
+                    return "drop", self._to_drop.popleft()
+                if self._closed:
+                    return None, None
+                self._cond.wait()
+
+    def _work(self):
+        while True:
+            task, url = self._next_task()
+
+            if task is None:
+                return
+
+            try:
+                if task == "create":
+                    create_database(url, template=self.template_name)
+                else:
+                    drop_database(url)
+            except Exception as e:
+                with self._cond:
+                    self._error = e
+                    self._closed = True
+                    self._cond.notify_all()
+                return
+
+            with self._cond:
+                if task == "create":
+                    self.created += 1
+                    self._ready.append(url)
+                else:
+                    self.dropped += 1
+                self._cond.notify_all()
+
+    def acquire(self, timeout=None):
+        """
+        Args:
+            timeout(float): Give up after waiting this many seconds for a clone. Waits indefinitely if None.
+
+        Returns:
+            url (str): URL of a freshly cloned database, for the caller's exclusive use until it's passed to `release`.
+        """
+        self.start()
+
+        started = default_timer()
+
+        with self._cond:
+            hit = bool(self._ready)
+
+            while not self._ready:
+                if self._error:
+                    raise self._error
+                if self._closed:
+                    raise RuntimeError("pool is closed")
+
+                remaining = None
+
+                if timeout is not None:
+                    remaining = timeout - (default_timer() - started)
+
+                    if remaining <= 0:
+                        raise RuntimeError("timed out waiting for a database")
+                self._cond.wait(remaining)
+
+            url = self._ready.popleft()
+            self._out.add(url)
+
+            waited = default_timer() - started
+
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self._cond.notify_all()
+        return url
+
+    def release(self, url):
+        """
+        Args:
+            url (str): A URL previously returned by `acquire`.
+
+        Hands a clone back to the pool, which drops it in the background. Raises ValueError for any other URL.
+        """
+        with self._cond:
+            if url not in self._out:
+                if self._closed:  # close() has already dropped it
+                    return
+                raise ValueError("not a database from this pool: {!r}".format(url))
+
+            self._out.remove(url)
+            self._to_drop.append(url)
+            self._cond.notify_all()
+
+    @contextmanager
+    def database(self, timeout=None):
+        """
+        Context manager version of `acquire` and `release`.
+        """
+        url = self.acquire(timeout=timeout)
+
+        try:
+            yield url
+        finally:
+            self.release(url)
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): Counts of hits (a clone was ready immediately) and misses, the hit rate, total/mean/max wait time in seconds, and numbers of clones created, dropped and currently ready.
+        """
+        with self._cond:
+            acquired = self.hits + self.misses
+
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / acquired if acquired else None,
+                total_wait=self.total_wait,
+                mean_wait=self.total_wait / acquired if acquired else None,
+                max_wait=self.max_wait,
+                created=self.created,
+                dropped=self.dropped,
+                ready=len(self._ready),
+            )
+
+    def close(self):
+        """
+        Stop the background thread, and drop every clone (including any still checked out) along with the template.
+        """
+        with self._cond:
+            if not self._worker:
+                return
+            self._closed = True
+            self._cond.notify_all()
+
+        self._worker.join()
+
+        with self._cond:
+            leftovers = list(self._ready) + list(self._out) + list(self._to_drop)
+            self._ready.clear()
+            self._out.clear()
+            self._to_drop.clear()
+            self._worker = None
+
+        for url in leftovers:
+            drop_database(url)
+
+            with self._cond:
+                self.dropped += 1
+
+        drop_database(self.template_url)
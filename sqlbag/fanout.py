@@ -0,0 +1,116 @@
+"""Running the same work against many databases at once."""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import math
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from timeit import default_timer
+
+from six import string_types
+from sqlalchemy.engine.url import make_url
+
+from .sqla import S, alter_url, raw_connection
+
+FanOutResult = namedtuple("FanOutResult", "url result error elapsed")
+
+
+def _run_sql(sql, params):
+    def run(s):
+        result = s.execute(sql, params or {})
+
+        if result.returns_rows:
+            return result.fetchall()
+        return result.rowcount
+
+    return run
+
+
+def _run_with_deadline(url, run, timeout, deadline):
+    url = make_url(url)
+
+    if url.get_backend_name() != "postgresql":
+        raise NotImplementedError("timeouts require postgresql")
+
+    # libpq only takes whole seconds, and treats anything less than 2 as 2
+    connect_timeout = max(2, int(math.ceil(deadline - default_timer())))
+    url = alter_url(url, query=dict(url.query, connect_timeout=str(connect_timeout)))
+
+    with S(url) as s:
+        # no single statement can outlast the whole timeout...
+        s.execute(
+            "select set_config('statement_timeout', :t, true)",
+            dict(t="{}ms".format(int(timeout * 1000))),
+        )
+
+        # ...and whatever is running when the deadline passes is cancelled
+        timer = threading.Timer(
+            max(0, deadline - default_timer()), raw_connection(s).cancel
+        )
+        timer.daemon = True
+        timer.start()
+
+        try:
+            return run(s)
+        finally:
+            timer.cancel()
+
+
+def _run_one(url, run, timeout):
+    started = default_timer()
+
+    try:
+        if timeout is None:
+            with S(url) as s:
+                result = run(s)
+        else:
+            result = _run_with_deadline(url, run, timeout, started + timeout)
+        return FanOutResult(url, result, None, default_timer() - started)
+    except Exception as e:
+        return FanOutResult(url, None, e, default_timer() - started)
+
+
+def fan_out(urls, sql_or_callable, params=None, max_workers=8, timeout=None):
+    """
+    Args:
+        urls: URLs of the databases.
+        sql_or_callable: SQL to execute, or a callable taking a session and returning a result.
+        params(dict): Parameters for the SQL.
+        max_workers(int): Maximum number of databases to work on at once.
+        timeout(float): Seconds each database gets, from connecting onwards (PostgreSQL only). Connecting gives up after libpq's `connect_timeout` (whole seconds, at least 2), no one statement may run longer than this (a transaction-local `statement_timeout`), and whatever is still running at the deadline is cancelled on the server. A database that times out gets the cancellation error as its `error`.
+
+    Returns:
+        An iterator of :class:`FanOutResult` (`url`, `result`, `error`, `elapsed`), in the order they finish.
+
+    Run the same SQL (or function) against each database, each in its own :func:`S` transaction, several at a time. For SQL, the result is the list of rows returned, or the row count if it doesn't return any.
+
+    Failures don't stop the rest: the exception is returned as `error` (and the transaction rolled back) instead.
+
+    .. code-block:: python
+
+        for r in fan_out(tenant_urls, 'select count(*) from orders', timeout=60):
+            print(r.url, r.error or r.result[0][0])
+
+    Sessions come from the usual cached engines, so running again against the same databases doesn't reconnect. When fanning out across hundreds of databases, consider bounding that cache with :func:`configure_session_cache`.
+
+    If you stop iterating early, databases not yet started are skipped.
+    """
+    if isinstance(sql_or_callable, string_types):
+        run = _run_sql(sql_or_callable, params)
+    else:
+        run = sql_or_callable
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = []
+
+    try:
+        for url in urls:
+            futures.append(executor.submit(_run_one, url, run, timeout))
+
+        for f in as_completed(futures):
+            yield f.result()
+    finally:
+        for f in futures:
+            f.cancel()
+        executor.shutdown(wait=True)
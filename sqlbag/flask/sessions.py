@@ -3,10 +3,11 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from flask import _app_ctx_stack, current_app
-from sqlalchemy import create_engine
 from sqlalchemy.orm import scoped_session, sessionmaker
 from werkzeug.local import LocalProxy
 
+from ..sqla import _create_engine
+
 FLASK_SCOPED_SESSION_MAKERS = []
 COMMIT_AFTER_REQUEST = []
 
@@ -54,7 +55,7 @@ def FS(*args, **kwargs):
     commit_after_request = kwargs.get("commit_after_request", True)
 
     s = scoped_session(
-        sessionmaker(bind=create_engine(*args, **kwargs)),
+        sessionmaker(bind=_create_engine(*args, **kwargs)),
         scopefunc=_app_ctx_stack.__ident_func__,
     )
 
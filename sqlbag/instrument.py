@@ -0,0 +1,387 @@
+"""Opt-in per-statement timing for the engines sqlbag creates."""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import copy
+import json
+import logging
+import re
+import threading
+import weakref
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from timeit import default_timer
+
+from six.moves import queue
+from sqlalchemy import create_engine, event, text
+
+from .routing import is_read_statement
+from .sqla import ENGINE_CACHES, ENGINE_HOOKS
+
+WHITESPACE = re.compile(r"\s+")
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize_statement(statement):
+    """
+    Args:
+        statement (str): An SQL statement.
+
+    Returns:
+        The statement with whitespace collapsed and literal strings and numbers replaced with `?`, so that statements differing only in those are counted together.
+    """
+    statement = LITERALS.sub("?", statement)
+    return WHITESPACE.sub(" ", statement).strip()
+
+
+def percentile(values, p):
+    """
+    Args:
+        values: A sorted list of numbers.
+        p (float): The percentile wanted, between 0 and 100.
+
+    Returns:
+        The value at that percentile (nearest rank), or None if there are no values.
+    """
+    if not values:
+        return None
+    rank = int(round(p / 100 * (len(values) - 1)))
+    return values[rank]
+
+
+class StatementStats(object):
+    """
+    Args:
+        sample_size (int): Number of recent timings kept per statement for working out percentiles.
+
+    The registry of timings for each normalized statement.
+    """
+
+    def __init__(self, sample_size=1000):
+        self.sample_size = sample_size
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement, elapsed, rowcount):
+        key = normalize_statement(statement)
+
+        with self._lock:
+            if key not in self.statements:
+                self.statements[key] = dict(
+                    count=0,
+                    total=0.0,
+                    rows=0,
+                    timings=deque(maxlen=self.sample_size),
+                )
+            s = self.statements[key]
+            s["count"] += 1
+            s["total"] += elapsed
+            s["timings"].append(elapsed)
+
+            if rowcount is not None and rowcount > 0:
+                s["rows"] += rowcount
+
+    def dump(self):
+        """
+        Returns:
+            stats (list): A dict for each statement, with its `count`, `total`, `mean`, `p50`, `p99` and `max` latency in seconds, and the number of `rows` it returned or affected. Sorted by total time, highest first.
+        """
+        with self._lock:
+            items = [
+                (key, dict(s, timings=sorted(s["timings"])))
+                for key, s in self.statements.items()
+            ]
+
+        results = []
+
+        for key, s in items:
+            timings = s["timings"]
+
+            results.append(
+                dict(
+                    statement=key,
+                    count=s["count"],
+                    total=s["total"],
+                    mean=s["total"] / s["count"],
+                    p50=percentile(timings, 50),
+                    p99=percentile(timings, 99),
+                    max=timings[-1],
+                    rows=s["rows"],
+                )
+            )
+        return sorted(results, key=lambda x: -x["total"])
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+
+
+STATEMENT_STATS = StatementStats()
+
+# weak, so engines evicted from the caches (or thrown away) can be collected
+INSTRUMENTED = weakref.WeakSet()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._sqlbag_started = default_timer()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = default_timer() - context._sqlbag_started
+    STATEMENT_STATS.record(statement, elapsed, getattr(cursor, "rowcount", None))
+
+
+def instrument_engine(engine):
+    """
+    Args:
+        engine: An SQLAlchemy :class:`Engine`.
+
+    Start recording statement timings for an engine. Does nothing if it's already being timed.
+    """
+    if not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        INSTRUMENTED.add(engine)
+
+
+def uninstrument_engine(engine):
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+
+    INSTRUMENTED.discard(engine)
+
+
+def _cached_engines():
+    for cache in ENGINE_CACHES:
+        for value in cache.values():
+            if hasattr(value, "session_factory"):
+                yield value.session_factory.kw["bind"].engine
+            else:
+                yield value.sync_engine
+
+
+def enable_instrumentation():
+    """
+    Record the timing of every statement executed through engines that sqlbag creates (for :func:`S`, :func:`session`, :func:`C`, :func:`FS <sqlbag.flask.FS>` and so on), both those already cached and any created from now on.
+
+    Read the results with `STATEMENT_STATS.dump()`.
+
+    Engines are left untouched until this is called, so there's no overhead otherwise.
+    """
+    if instrument_engine not in ENGINE_HOOKS:
+        ENGINE_HOOKS.append(instrument_engine)
+
+    for engine in _cached_engines():
+        instrument_engine(engine)
+
+
+def disable_instrumentation():
+    """
+    Stop recording statement timings, and remove the listeners from every engine. Recorded stats are kept until `STATEMENT_STATS.reset()`.
+    """
+    if instrument_engine in ENGINE_HOOKS:
+        ENGINE_HOOKS.remove(instrument_engine)
+
+    for engine in list(INSTRUMENTED):
+        uninstrument_engine(engine)
+
+
+class SlowQueryLog(object):
+    """
+    Args:
+        path (str): File to write to, one JSON object per line.
+        threshold (float): Log statements taking at least this many seconds.
+        explain (bool): On PostgreSQL, capture an `EXPLAIN (FORMAT JSON)` of each slow statement.
+        analyze (bool): Use `EXPLAIN (ANALYZE, FORMAT JSON)` for read-only statements, which runs them again to get actual timings.
+        max_bytes (int): Rotate the file when it reaches this size.
+        backup_count (int): Number of rotated files to keep.
+        queue_size (int): Most slow statements to hold while waiting to be explained and written. Any more are dropped (and counted in `dropped`) rather than holding up the application.
+
+    Logs every statement that takes longer than the threshold, with its parameters, duration, row count and database URL (without password).
+
+    Statements are explained and written by a background thread, so a slow statement isn't made any slower by logging it. Plans are captured on a separate one-connection pool for each database, so that logging never waits on (or uses up) the engine's own pool, and isn't itself timed and logged. Since each statement is explained shortly after it ran, on a connection that can't see anything uncommitted in the original transaction, statements on tables created in that transaction (or since dropped) get an `explain_error` instead of a plan. `ANALYZE` runs in a read-only transaction that's rolled back afterwards, so it can never change anything.
+
+    Usually created with :func:`enable_slow_query_log`.
+    """
+
+    def __init__(
+        self,
+        path,
+        threshold=1.0,
+        explain=True,
+        analyze=False,
+        max_bytes=10 * 1024 * 1024,
+        backup_count=5,
+        queue_size=100,
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.explain = explain
+        self.analyze = analyze
+        self.handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count
+        )
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+        self.engines = weakref.WeakSet()
+        self.dropped = 0
+        self._explain_engines = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = threading.Thread(target=self._work)
+        self._worker.daemon = True
+        self._worker.start()
+
+    def _before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        context._sqlbag_slow_started = default_timer()
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        elapsed = default_timer() - context._sqlbag_slow_started
+
+        if elapsed < self.threshold:
+            return
+
+        entry = dict(
+            time=datetime.utcnow().isoformat() + "Z",
+            duration=elapsed,
+            database=repr(conn.engine.url),
+            statement=statement,
+            parameters=copy.copy(parameters),
+            rowcount=getattr(cursor, "rowcount", None),
+        )
+        explain = None
+
+        if self.explain and not executemany and conn.dialect.name == "postgresql":
+            try:
+                sql = cursor.mogrify(statement, parameters or None).decode("utf-8")
+                analyze = self.analyze and is_read_statement(text(statement))
+                explain = (conn.engine.url, sql, analyze)
+            except Exception as e:
+                entry["explain_error"] = str(e).strip()
+
+        try:
+            self._queue.put_nowait((entry, explain))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+
+            if item is None:
+                return
+
+            entry, explain = item
+
+            if explain:
+                try:
+                    entry["plan"] = self._explain(*explain)
+                except Exception as e:
+                    entry["explain_error"] = str(e).strip()
+
+            self.write(entry)
+
+    def _explain(self, url, sql, analyze):
+        raw = self._explain_engine(url).raw_connection()
+
+        try:
+            explain_cursor = raw.cursor()
+
+            if analyze:
+                explain_cursor.execute("set transaction read only")
+                explain_cursor.execute("explain (analyze, format json) " + sql)
+            else:
+                explain_cursor.execute("explain (format json) " + sql)
+            plan = explain_cursor.fetchone()[0]
+        finally:
+            raw.rollback()
+            raw.close()
+
+        if not isinstance(plan, (list, dict)):
+            plan = json.loads(plan)
+        return plan
+
+    def _explain_engine(self, url):
+        with self._lock:
+            if url not in self._explain_engines:
+                self._explain_engines[url] = create_engine(
+                    url, pool_size=1, max_overflow=0
+                )
+            return self._explain_engines[url]
+
+    def write(self, entry):
+        line = json.dumps(entry, default=str, sort_keys=True)
+        self.handler.handle(logging.makeLogRecord(dict(msg=line)))
+
+    def attach(self, engine):
+        if not event.contains(
+            engine, "after_cursor_execute", self._after_cursor_execute
+        ):
+            event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+            self.engines.add(engine)
+
+    def detach(self, engine):
+        if event.contains(engine, "after_cursor_execute", self._after_cursor_execute):
+            event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+
+        self.engines.discard(engine)
+
+    def close(self):
+        """
+        Detach from every engine, finish writing what's queued, and close the file.
+        """
+        for engine in list(self.engines):
+            self.detach(engine)
+
+        self._queue.put(None)
+        self._worker.join()
+
+        with self._lock:
+            for engine in self._explain_engines.values():
+                engine.dispose()
+            self._explain_engines.clear()
+        self.handler.close()
+
+
+SLOW_QUERY_LOGS = []
+
+
+def enable_slow_query_log(path, **kwargs):
+    """
+    Args:
+        path (str): File to write to.
+        kwargs: Other arguments to :class:`SlowQueryLog`, such as `threshold`.
+
+    Returns:
+        SlowQueryLog: The log, attached to every engine sqlbag has created or creates from now on.
+
+    .. code-block:: python
+
+        enable_slow_query_log('/var/log/app/slow.jsonl', threshold=0.5, analyze=True)
+    """
+    log = SlowQueryLog(path, **kwargs)
+    ENGINE_HOOKS.append(log.attach)
+    SLOW_QUERY_LOGS.append(log)
+
+    for engine in _cached_engines():
+        log.attach(engine)
+    return log
+
+
+def disable_slow_query_log():
+    """
+    Close every log created with :func:`enable_slow_query_log`.
+    """
+    while SLOW_QUERY_LOGS:
+        log = SLOW_QUERY_LOGS.pop()
+        ENGINE_HOOKS.remove(log.attach)
+        log.close()
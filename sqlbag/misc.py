@@ -1,10 +1,22 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import hashlib
 import io
 import sys
+from collections import OrderedDict
 from pathlib import Path
+from timeit import default_timer
 
-from .sqla import raw_execute
+from sqlalchemy import text as sqltext
+
+from .sqla import connection_from_s_or_c, raw_execute
+
+LEDGER_TABLE = """
+    create table if not exists {} (
+        path varchar(512) primary key,
+        checksum varchar(64) not null
+    )
+"""
 
 
 def quoted_identifier(identifier):
@@ -57,18 +69,39 @@ def sql_from_folder(fpath):
     return list(sql for _, sql in sql_from_folder_iter(fpath))
 
 
-def load_sql_from_folder(s, fpath, verbose=False, out=None):
+def _checksum(sql):
+    return hashlib.sha256(sql.encode("utf-8")).hexdigest()
+
+
+def _read_ledger(s, ledger):
+    s.execute(sqltext(LEDGER_TABLE.format(ledger)))
+    rows = s.execute(sqltext("select path, checksum from {}".format(ledger)))
+    return dict(rows.fetchall())
+
+
+def _record_in_ledger(s, ledger, path, checksum):
+    params = dict(path=path, checksum=checksum)
+    s.execute(sqltext("delete from {} where path = :path".format(ledger)), params)
+    s.execute(
+        sqltext("insert into {} values (:path, :checksum)".format(ledger)), params
+    )
+
+
+def load_sql_from_folder(s, fpath, verbose=False, out=None, ledger=None):
     """
     Args:
         s (Session): Applies the SQL to this session.
         fpath (str): The path to the file.
         verbose (bool): Prints some information as it loads files.
         out (stream): Change where verbose mode prints to. defaults to sys.stdout
+        ledger (str): Name of a table to record what's been applied in, for incremental loading.
 
     Returns:
-        sql (str): The file contents as a string, with any whitespace stripped from the start and end.
+        results (dict): `applied`, an OrderedDict of the path of each file run to the seconds it took, and `skipped`, a list of paths of unchanged files that were skipped.
 
-    Iterate through all the .sql files in a folder.
+    Iterate through all the .sql files in a folder (including subfolders), in order, and run them.
+
+    With a `ledger`, the table is created if it doesn't exist, and a checksum of each file's contents is stored in it, keyed by the file's path relative to the folder. Files whose checksum hasn't changed since they were last applied are skipped, so running the same folder again is almost free. The ledger is updated in the same transaction, so a failed load leaves it as it was.
     """
 
     if verbose:
@@ -76,10 +109,39 @@ def load_sql_from_folder(s, fpath, verbose=False, out=None):
             out = sys.stdout  # pragma: no cover
         out.write("Running all .sql files in: {}".format(fpath))
 
-    for fpath, text in sql_from_folder_iter(fpath):
+    folder = Path(fpath)
+
+    if ledger:
+        quote = connection_from_s_or_c(s).dialect.identifier_preparer.quote
+        ledger = quote(ledger)
+        applied_checksums = _read_ledger(s, ledger)
+
+    applied = OrderedDict()
+    skipped = []
+
+    for fpath, text in sql_from_folder_iter(folder):
+        path = fpath.relative_to(folder).as_posix()
+
+        if ledger:
+            checksum = _checksum(text)
+
+            if applied_checksums.get(path) == checksum:
+                if verbose:
+                    out.write("    Skipping unchanged: {}".format(fpath))
+                skipped.append(path)
+                continue
+
         if verbose:
             out.write("    Running SQL in: {}".format(fpath))
+
+        started = default_timer()
         raw_execute(s, text)
+        applied[path] = default_timer() - started
+
+        if ledger:
+            _record_in_ledger(s, ledger, path, checksum)
+
+    return dict(applied=applied, skipped=skipped)
 
 
 def load_sql_from_file(s_or_c, fpath):
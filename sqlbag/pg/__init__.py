@@ -9,3 +9,5 @@ from .postgresql import (
 )  # noqa
 
 from .datetimes import use_pendulum_for_time_types, format_relativedelta  # noqa
+from .copy import copy_in, copy_out  # noqa
+from .retry import retrying_transaction, RETRYABLE_ERRORS  # noqa
@@ -0,0 +1,316 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import binascii
+import gzip
+import io
+import itertools
+import json
+import re
+import threading
+from datetime import date, datetime, time, timedelta
+
+import six
+from dateutil.relativedelta import relativedelta
+from psycopg2.extensions import QueryCanceledError
+from six.moves import queue
+
+from sqlbag import quoted_identifier, raw_connection
+
+from .datetimes import format_relativedelta
+
+COPY_ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+
+COPY_ESCAPE_PATTERN = re.compile(r"[\\\t\n\r]")
+
+COPY_NULL = "\\N"
+
+COPY_FORMATS = ("csv", "text", "binary")
+
+QUERY_PATTERN = re.compile(r"^\s*\(?\s*(select|with|values|table)\b", re.IGNORECASE)
+
+
+def _array_literal(values):
+    def element(x):
+        if x is None:
+            return "NULL"
+        if isinstance(x, (list, tuple)):
+            return _array_literal(x)
+        text = as_copy_text(x).replace("\\", "\\\\").replace('"', '\\"')
+        return '"{}"'.format(text)
+
+    return "{" + ",".join(element(x) for x in values) + "}"
+
+
+def as_copy_text(value):
+    """
+    Args:
+        value: A Python value (not None).
+
+    Returns:
+        The text PostgreSQL accepts as input for that value, before any COPY escaping.
+
+    Handles the same types the psycopg2 adapters do, including pendulum datetimes and relativedeltas. Dicts become JSON, and lists and tuples become array literals.
+    """
+    if isinstance(value, six.text_type):
+        return value
+    elif isinstance(value, bool):
+        return "t" if value else "f"
+    elif isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    elif isinstance(value, relativedelta):
+        return format_relativedelta(value) or "0 seconds"
+    elif isinstance(value, timedelta):
+        return "{} days {} seconds {} microseconds".format(
+            value.days, value.seconds, value.microseconds
+        )
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\x" + binascii.hexlify(bytes(value)).decode("ascii")
+    elif isinstance(value, dict):
+        return json.dumps(value)
+    elif isinstance(value, (list, tuple)):
+        return _array_literal(value)
+    return six.text_type(value)
+
+
+def copy_field(value):
+    """
+    Args:
+        value: A Python value.
+
+    Returns:
+        The value as a field in COPY's text format: `\\N` for None, with backslashes, tabs and newlines escaped.
+    """
+    if value is None:
+        return COPY_NULL
+    text = as_copy_text(value)
+    return COPY_ESCAPE_PATTERN.sub(lambda m: COPY_ESCAPES[m.group(0)], text)
+
+
+class CopyInStream(object):
+    """
+    Args:
+        lines: An iterable of strings.
+
+    A read-only file-like object over an iterable of strings, encoding just as much as each `read()` asks for.
+    """
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.chunks = []
+        self.buffered = 0
+
+    def read(self, size=-1):
+        while size < 0 or self.buffered < size:
+            try:
+                chunk = next(self.lines).encode("utf-8")
+            except StopIteration:
+                break
+            self.chunks.append(chunk)
+            self.buffered += len(chunk)
+
+        data = b"".join(self.chunks)
+
+        if 0 <= size < len(data):
+            data, rest = data[:size], data[size:]
+            self.chunks = [rest]
+        else:
+            self.chunks = []
+
+        self.buffered = sum(len(_) for _ in self.chunks)
+        return data
+
+
+def _qualified_table(table):
+    return ".".join(quoted_identifier(part) for part in table.split("."))
+
+
+def copy_in(s_or_c, table, rows, columns=None, size=8192):
+    """
+    Args:
+        s_or_c: SQLAlchemy :class:`Session` or :class:`Connection` to use.
+        table (str): Name of the table, optionally schema-qualified. Each part is quoted, so give it exactly as it's named.
+        rows: An iterable (such as a generator) of tuples or dicts.
+        columns (list): Names of the columns the values go into. Defaults to the keys of the first row for dicts, or all the table's columns in order for tuples.
+        size (int): Number of bytes to send to the server at a time.
+
+    Returns:
+        The number of rows copied.
+
+    Bulk load rows into a table with `COPY ... FROM STDIN`, which is much faster than inserting them. Rows are encoded incrementally as the server reads them, so memory use doesn't depend on how many there are.
+
+    Runs in the current transaction of the session or connection.
+    """
+    rows = iter(rows)
+
+    try:
+        first = next(rows)
+    except StopIteration:
+        return 0
+
+    rows = itertools.chain([first], rows)
+
+    if isinstance(first, dict):
+        if columns is None:
+            columns = list(first)
+        rows = ([row.get(c) for c in columns] for row in rows)
+
+    lines = ("\t".join(copy_field(v) for v in row) + "\n" for row in rows)
+
+    sql = "copy {}".format(_qualified_table(table))
+
+    if columns:
+        sql += " ({})".format(", ".join(quoted_identifier(c) for c in columns))
+    sql += " from stdin"
+
+    cursor = raw_connection(s_or_c).cursor()
+
+    try:
+        cursor.copy_expert(sql, CopyInStream(lines), size=size)
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+class _ChunkWriter(object):
+    # collects the small per-row writes from copy_expert into larger chunks
+    def __init__(self, q, size):
+        self.q = q
+        self.size = size
+        self.chunks = []
+        self.buffered = 0
+        self.stopped = False
+
+    def write(self, data):
+        if self.stopped:
+            return
+        self.chunks.append(bytes(data))
+        self.buffered += len(data)
+
+        if self.buffered >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.chunks and not self.stopped:
+            self.q.put(b"".join(self.chunks))
+        self.chunks = []
+        self.buffered = 0
+
+
+def _iter_copy_out(cursor, sql, size):
+    q = queue.Queue(maxsize=16)
+    writer = _ChunkWriter(q, size)
+    done = object()
+    errors = []
+
+    conn = cursor.connection
+    # a savepoint to roll back to if the copy is cancelled part way, so the
+    # rest of the transaction stays usable
+    savepoint = not conn.autocommit
+
+    if savepoint:
+        cursor.execute("savepoint sqlbag_copy_out")
+
+    def run():
+        try:
+            cursor.copy_expert(sql, writer)
+            writer.flush()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            q.put(done)
+
+    t = threading.Thread(target=run)
+    t.daemon = True
+    t.start()
+
+    finished = False
+
+    try:
+        while True:
+            chunk = q.get()
+
+            if chunk is done:
+                finished = True
+                break
+            yield chunk
+    finally:
+        if not finished:
+            # the caller stopped early: cancel the rest of the copy on the
+            # server, discarding whatever output is already on its way
+            writer.stopped = True
+            conn.cancel()
+
+        while t.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        t.join()
+
+        cancelled = not finished and all(
+            isinstance(e, QueryCanceledError) for e in errors
+        )
+
+        if errors and cancelled:
+            del errors[:]
+
+        if savepoint:
+            if errors or cancelled:
+                cursor.execute("rollback to savepoint sqlbag_copy_out")
+            cursor.execute("release savepoint sqlbag_copy_out")
+        cursor.close()
+
+    if errors:
+        raise errors[0]
+
+
+def copy_out(
+    s_or_c, query_or_table, dest=None, format="csv", header=False, size=65536
+):
+    """
+    Args:
+        s_or_c: SQLAlchemy :class:`Session` or :class:`Connection` to use.
+        query_or_table (str): A query (starting with select, with, values or table), or the name of a table, optionally schema-qualified.
+        dest: Where to write the output: a binary file object (such as a :class:`gzip.GzipFile`), or a path (gzipped if it ends in .gz). If None, return an iterator of byte chunks instead.
+        format (str): 'csv', 'text' or 'binary'.
+        header (bool): Include a header line (csv only).
+        size (int): Approximate size of each chunk, when returning an iterator.
+
+    Returns:
+        The number of rows copied, or an iterator of byte chunks if `dest` is None.
+
+    Export data with `COPY ... TO STDOUT`, which streams the server's output straight through without creating any Python row objects.
+
+    When iterating, the copy runs in a background thread. If you stop iterating early, close the iterator: the query is then cancelled on the server. Inside a transaction, the copy runs in a savepoint that's rolled back on cancellation, so the transaction stays usable.
+    """
+    if format not in COPY_FORMATS:
+        raise ValueError("format must be one of: {}".format(", ".join(COPY_FORMATS)))
+
+    if QUERY_PATTERN.match(query_or_table):
+        source = "({})".format(query_or_table.strip().rstrip(";"))
+    else:
+        source = _qualified_table(query_or_table)
+
+    options = ["format {}".format(format)]
+
+    if header:
+        options.append("header true")
+
+    sql = "copy {} to stdout with ({})".format(source, ", ".join(options))
+
+    cursor = raw_connection(s_or_c).cursor()
+
+    if dest is None:
+        return _iter_copy_out(cursor, sql, size)
+
+    try:
+        if isinstance(dest, six.string_types):
+            opener = gzip.open if dest.endswith(".gz") else io.open
+
+            with opener(dest, "wb") as f:
+                cursor.copy_expert(sql, f)
+        else:
+            cursor.copy_expert(sql, dest)
+        return cursor.rowcount
+    finally:
+        cursor.close()
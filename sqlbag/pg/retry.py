@@ -0,0 +1,189 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import functools
+import random
+import threading
+import time
+from timeit import default_timer
+
+from sqlbag import S
+
+from .postgresql import pg_errorname_lookup
+
+RETRYABLE_ERRORS = ("SERIALIZATION_FAILURE", "DEADLOCK_DETECTED")
+
+RETRY_OPTIONS = dict(
+    max_attempts=5, base_delay=0.05, max_delay=2.0, deadline=None, retry_on=None
+)
+
+
+def error_name(e):
+    """
+    Args:
+        e: An exception, either wrapped by SQLAlchemy or raised directly by the driver (as from :func:`raw_execute`).
+
+    Returns:
+        The PostgreSQL name of the error (eg 'SERIALIZATION_FAILURE'), or None if it didn't come from PostgreSQL.
+    """
+    pgcode = getattr(getattr(e, "orig", e), "pgcode", None)
+
+    if pgcode:
+        return pg_errorname_lookup(pgcode)
+
+
+class _Attempt(object):
+    def __init__(self, retrier, number, started):
+        self.retrier = retrier
+        self.number = number
+        self.started = started
+        self.error = None
+
+    def __enter__(self):
+        self.cm = S(*self.retrier.args, **self.retrier.kwargs)
+        return self.cm.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        committing = exc is None
+
+        try:
+            self.cm.__exit__(exc_type, exc, tb)
+        except Exception as e:
+            # the commit itself failed
+            exc = e
+
+        if exc is None:
+            return False
+
+        if self.retrier._should_retry(exc, self.number, self.started):
+            self.error = exc
+            return True
+
+        if committing:
+            raise exc
+        return False
+
+
+class retrying_transaction(object):
+    """
+    Args:
+        args: Same arguments as you'd pass to :func:`S`.
+        max_attempts(int): Give up after this many attempts.
+        base_delay(float): Seconds to wait before the first retry. Doubles each time, up to `max_delay`, and a random amount (full jitter) of it is used.
+        max_delay(float): Longest to wait between attempts.
+        deadline(float): Don't retry if it'd mean finishing more than this many seconds after the first attempt started. No limit if None.
+        retry_on: PostgreSQL error names to retry on. Defaults to `RETRYABLE_ERRORS`: serialization failures and deadlocks.
+        kwargs: Other arguments, as you'd pass to :func:`S`.
+
+    Run a transaction in :func:`S`, rerunning it from the beginning if it fails with a serialization failure (40001) or deadlock (40P01), as PostgreSQL expects clients to do at the SERIALIZABLE and REPEATABLE READ isolation levels. This includes failures at commit time.
+
+    As a decorator, the function gets the session as its first argument:
+
+    .. code-block:: python
+
+        @retrying_transaction(db_url, isolation_level='SERIALIZABLE')
+        def transfer(s, a, b, amount):
+            ...
+
+        transfer(1, 2, 100)
+
+    Or iterate over it to retry a block of code:
+
+    .. code-block:: python
+
+        for attempt in retrying_transaction(db_url, isolation_level='SERIALIZABLE'):
+            with attempt as s:
+                ...
+
+    The transaction must be safe to run more than once, so avoid side effects outside the database.
+
+    Counts of attempts, retries and errors retried, accumulated over every use, are available from `stats()`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        options = {k: kwargs.pop(k, v) for k, v in RETRY_OPTIONS.items()}
+
+        self.max_attempts = options["max_attempts"]
+        self.base_delay = options["base_delay"]
+        self.max_delay = options["max_delay"]
+        self.deadline = options["deadline"]
+        self.retry_on = set(options["retry_on"] or RETRYABLE_ERRORS)
+
+        self.args = args
+        self.kwargs = kwargs
+
+        self.attempts = 0
+        self.retries = 0
+        self.gave_up = 0
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        started = default_timer()
+        number = 0
+
+        while True:
+            number += 1
+
+            with self._lock:
+                self.attempts += 1
+            attempt = _Attempt(self, number, started)
+            yield attempt
+
+            if attempt.error is None:
+                return
+
+    def _delay(self, number):
+        delay = min(self.max_delay, self.base_delay * 2 ** (number - 1))
+        return random.uniform(0, delay)
+
+    def _should_retry(self, e, number, started):
+        name = error_name(e)
+
+        if name not in self.retry_on:
+            return False
+
+        delay = self._delay(number)
+        elapsed = default_timer() - started
+
+        out_of_time = self.deadline is not None and elapsed + delay > self.deadline
+
+        with self._lock:
+            if number >= self.max_attempts or out_of_time:
+                self.gave_up += 1
+                return False
+
+            self.retries += 1
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+        time.sleep(delay)
+        return True
+
+    def run(self, f, *args, **kwargs):
+        """
+        Call `f(s, *args, **kwargs)` in a retried transaction, and return the result.
+        """
+        for attempt in self:
+            with attempt as s:
+                result = f(s, *args, **kwargs)
+        return result
+
+    def __call__(self, f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            return self.run(f, *args, **kwargs)
+
+        wrapper.retrier = self
+        return wrapper
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): Numbers of attempts, retries and times it gave up on a retryable error, plus retry counts by error name.
+        """
+        with self._lock:
+            return dict(
+                attempts=self.attempts,
+                retries=self.retries,
+                gave_up=self.gave_up,
+                errors=dict(self.errors),
+            )
@@ -0,0 +1,211 @@
+"""Routing sessions between a primary database and its read replicas."""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import re
+import threading
+from timeit import default_timer
+
+from sqlalchemy.orm import Session
+
+STRATEGIES = ("round_robin", "least_loaded")
+
+ROUTING_OPTIONS = ("strategy", "max_lag", "lag_check_interval")
+
+READ_STATEMENT = re.compile(r"^\s*\(?\s*(select|values|table)\b", re.IGNORECASE)
+
+WRITE_HINT = re.compile(r"\binto\b|\bfor\s+(no\s+key\s+)?(update|share)\b", re.IGNORECASE)
+
+# zero if the replica has replayed everything it has received, so that an
+# idle primary doesn't look like replica lag
+REPLICA_LAG = """
+    select
+        case
+            when not pg_is_in_recovery()
+                or pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() then 0
+            else extract(epoch from now() - pg_last_xact_replay_timestamp())
+        end
+"""
+
+
+def is_read_statement(clause):
+    """
+    Args:
+        clause: An SQLAlchemy statement or :class:`TextClause`.
+
+    Returns:
+        True if the statement is a plain select (or values or table), without `for update`/`for share` or `into`.
+    """
+    text = getattr(clause, "text", None)
+
+    if text is None:
+        if not getattr(clause, "is_select", False):
+            return False
+        if getattr(clause, "_for_update_arg", None) is not None:
+            return False
+        text = str(clause)
+
+    return bool(READ_STATEMENT.match(text)) and not WRITE_HINT.search(text)
+
+
+class ReplicaSet(object):
+    """
+    Args:
+        primary: :class:`Engine` for the primary database.
+        replicas: List of :class:`Engine` for its replicas.
+        strategy(str): How to pick a replica: 'round_robin', or 'least_loaded' (fewest connections checked out of its pool).
+        max_lag(float): Don't use replicas that are more than this many seconds behind the primary (or that can't be reached). If None, lag isn't checked.
+        lag_check_interval(float): Seconds to reuse a replica's measured lag for before checking again.
+
+    Picks which replica each read-only session should use. When no replica is usable, the primary is used instead.
+
+    Lag is measured on PostgreSQL with `pg_last_xact_replay_timestamp()`. For other databases, replicas are assumed to be current.
+    """
+
+    def __init__(
+        self,
+        primary,
+        replicas,
+        strategy="round_robin",
+        max_lag=None,
+        lag_check_interval=1.0,
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError("strategy must be one of: {}".format(", ".join(STRATEGIES)))
+
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+
+        self.routed = {}
+        self.fallbacks = 0
+
+        self._next = 0
+        self._lags = {}
+        self._lock = threading.Lock()
+
+    def _measure_lag(self, engine):
+        if engine.dialect.name != "postgresql":
+            return 0.0
+
+        try:
+            with engine.connect() as c:
+                return float(c.execute(REPLICA_LAG).scalar())
+        except Exception:
+            return None
+
+    def lag(self, engine):
+        """
+        Args:
+            engine: One of the replica engines.
+
+        Returns:
+            lag (float): Seconds the replica is behind, or None if it couldn't be reached.
+        """
+        now = default_timer()
+
+        with self._lock:
+            checked = self._lags.get(engine)
+
+        if checked and now - checked[0] < self.lag_check_interval:
+            return checked[1]
+
+        lag = self._measure_lag(engine)
+
+        with self._lock:
+            self._lags[engine] = (now, lag)
+        return lag
+
+    def usable(self):
+        """
+        Returns:
+            replicas (list): The replica engines within `max_lag`.
+        """
+        if self.max_lag is None:
+            return list(self.replicas)
+
+        usable = []
+
+        for engine in self.replicas:
+            lag = self.lag(engine)
+
+            if lag is not None and lag <= self.max_lag:
+                usable.append(engine)
+        return usable
+
+    def choose(self):
+        """
+        Returns:
+            engine: The engine a read-only session should use.
+        """
+        candidates = self.usable()
+
+        with self._lock:
+            if not candidates:
+                self.fallbacks += 1
+                engine = self.primary
+            elif self.strategy == "least_loaded":
+                engine = min(candidates, key=_checked_out)
+            else:
+                engine = candidates[self._next % len(candidates)]
+                self._next += 1
+
+            key = repr(engine.url)
+            self.routed[key] = self.routed.get(key, 0) + 1
+        return engine
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): How many sessions were routed to each database (by URL, without password), how many fell back to the primary because no replica was usable, and each replica's last measured lag.
+        """
+        with self._lock:
+            return dict(
+                routed=dict(self.routed),
+                fallbacks=self.fallbacks,
+                lags={repr(e.url): lag for e, (_, lag) in self._lags.items()},
+            )
+
+
+def _checked_out(engine):
+    try:
+        return engine.pool.checkedout()
+    except AttributeError:  # pools such as NullPool don't count
+        return 0
+
+
+class RoutingSession(Session):
+    """
+    Args:
+        replica_set(ReplicaSet): Where reads can go.
+        read_only(bool): True to send everything to a replica, False to send everything to the primary. If None, reads go to a replica until the session first writes, flushes or asks for its connection directly, and from then on everything goes to the primary, so the session sees its own writes.
+
+    A :class:`Session` that sends reads to a replica. It sticks with one replica for its lifetime.
+
+    Created by :func:`S` and :func:`session` when given `replicas`.
+    """
+
+    def __init__(self, replica_set=None, read_only=None, **kwargs):
+        super(RoutingSession, self).__init__(**kwargs)
+        self.replica_set = replica_set
+        self.read_only = read_only
+        self._use_primary = read_only is False
+        self._replica = None
+
+    def _replica_bind(self):
+        if self._replica is None:
+            self._replica = self.replica_set.choose()
+        return self._replica
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.read_only:
+            return self._replica_bind()
+
+        if not self._use_primary and not self._flushing:
+            if clause is not None and is_read_statement(clause):
+                return self._replica_bind()
+
+        self._use_primary = True
+        return self.replica_set.primary
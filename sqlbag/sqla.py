@@ -2,10 +2,16 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import atexit
 import copy
 import getpass
+import itertools
+import re
+import threading
+import time
+from collections import OrderedDict
 from contextlib import contextmanager
-from packaging import version
+from timeit import default_timer
 
 import sqlalchemy
 import sqlalchemy.engine.url
@@ -13,15 +19,20 @@ import sqlalchemy.exc
 import sqlalchemy.orm
 import sqlalchemy.orm.session
 from six import string_types
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine import Engine
 from sqlalchemy.engine.url import make_url
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.pool import NullPool
 from sqlalchemy.sql import text
 
+from .routing import ROUTING_OPTIONS, ReplicaSet, RoutingSession
+from .util_mysql import MYSQL_ACTIVITY
 from .util_mysql import MYSQL_KILLQUERY_FORMAT as MYSQL_KILL
+from .util_pg import PSQL_ACTIVITY_INCLUDING_DROPPED as PG_ACTIVITY
 from .util_pg import PSQL_KILLQUERY_FORMAT_INCLUDING_DROPPED as PG_KILL
+from .util_pg import PSQL_PUBLIC_CONNECT as PG_PUBLIC_CONNECT
+from .util_pg import PSQL_TERMINATE_PIDS as PG_TERMINATE
 
 DB_ERROR_TUPLE = (
     sqlalchemy.exc.OperationalError,
@@ -29,17 +40,182 @@ DB_ERROR_TUPLE = (
     sqlalchemy.exc.ProgrammingError,
 )
 
-SCOPED_SESSION_MAKERS = {}
 
-SQLA14 = version.parse(sqlalchemy.__version__) >= version.parse('1.4.0b1')
+class LRUCache(object):
+    """
+    Args:
+        maxsize(int): Maximum number of entries. Unbounded if None.
+        ttl(float): Evict entries that haven't been used for this many seconds. Never if None.
+        on_evict: Called with each (key, value) pair that's evicted.
+
+    A thread-safe least-recently-used cache, with counters for hits, misses and evictions.
+    """
+
+    def __init__(self, maxsize=None, ttl=None, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._items = OrderedDict()
+        self._lock = threading.RLock()
+
+    def configure(self, maxsize=None, ttl=None):
+        """
+        Change the size limit and idle TTL, evicting anything that no longer fits.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self.expire()
+
+    def get_or_create(self, key, create):
+        """
+        Args:
+            key: The cache key.
+            create: Called with no arguments to create the value if it isn't cached.
+
+        Returns:
+            The cached value.
+        """
+        with self._lock:
+            self.expire()
+
+            if key in self._items:
+                self.hits += 1
+                return self[key]
+
+            self.misses += 1
+            value = create()
+            self[key] = value
+            return value
+
+    def expire(self):
+        """
+        Evict entries that are past their idle TTL or beyond the size limit.
+        """
+        evicted = []
+
+        with self._lock:
+            if self.ttl is not None:
+                cutoff = default_timer() - self.ttl
+
+                # least recently used first, so stop at the first fresh one
+                while self._items:
+                    key, (value, last_used) = next(iter(self._items.items()))
+
+                    if last_used >= cutoff:
+                        break
+                    del self._items[key]
+                    evicted.append((key, value))
+
+            if self.maxsize is not None:
+                while len(self._items) > self.maxsize:
+                    key, (value, _) = self._items.popitem(last=False)
+                    evicted.append((key, value))
+
+            self.evictions += len(evicted)
+
+        if self.on_evict:
+            for key, value in evicted:
+                self.on_evict(key, value)
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): The hits, misses, evictions and current size.
+        """
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                size=len(self._items),
+            )
+
+    def discard(self, key):
+        """
+        Evict one entry, if it's there.
+        """
+        with self._lock:
+            item = self._items.pop(key, None)
+
+            if item:
+                self.evictions += 1
+
+        if item and self.on_evict:
+            self.on_evict(key, item[0])
+
+    def clear(self):
+        """
+        Evict everything.
+        """
+        with self._lock:
+            evicted = [(key, value) for key, (value, _) in self._items.items()]
+            self._items.clear()
+            self.evictions += len(evicted)
+
+        if self.on_evict:
+            for key, value in evicted:
+                self.on_evict(key, value)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        with self._lock:
+            value, _ = self._items.pop(key)
+            self._items[key] = (value, default_timer())
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (value, default_timer())
+        self.expire()
+
+    def __len__(self):
+        return len(self._items)
+
+    def keys(self):
+        with self._lock:
+            return list(self._items)
 
+    def values(self):
+        with self._lock:
+            return [value for value, _ in self._items.values()]
 
-try:
-    import secrets
-    scopefunc = secrets.token_hex
-except ImportError:
-    import random
-    scopefunc = random.random
+    def items(self):
+        with self._lock:
+            return [(key, value) for key, (value, _) in self._items.items()]
+
+
+def _dispose_session_maker(key, Session):
+    Session.session_factory.kw["bind"].engine.dispose()
+
+
+SCOPED_SESSION_MAKERS = LRUCache(on_evict=_dispose_session_maker)
+
+# every engine cache that configure_session_cache applies to
+ENGINE_CACHES = [SCOPED_SESSION_MAKERS]
+
+# called with each new engine that sqlbag creates
+ENGINE_HOOKS = []
+
+ADMIN_CONNECTIONS = []
+
+SQLA14 = tuple(int(_) for _ in re.findall(r"\d+", sqlalchemy.__version__)[:2]) >= (1, 4)
+
+
+def _create_engine(*args, **kwargs):
+    e = create_engine(*args, **kwargs)
+
+    for hook in ENGINE_HOOKS:
+        hook(e)
+    return e
 
 
 def copy_url(db_url):
@@ -103,6 +279,8 @@ def get_raw_autocommit_connection(url_or_engine_or_connection):
 
     Sometimes you want just want to autocommit.
 
+    This opens (or detaches from the pool) a new connection every time, which the caller must close. To run many statements this way, :func:`autocommit_connection` is much cheaper.
+
     """
     x = url_or_engine_or_connection
 
@@ -125,6 +303,88 @@ def get_raw_autocommit_connection(url_or_engine_or_connection):
     return x
 
 
+def _checkout_healthy(engine):
+    # check the connection is alive, replacing it (and any other idle pooled
+    # connections, which are likely just as stale) if not
+    for retry in (False, True):
+        rawc = engine.raw_connection()
+
+        try:
+            cursor = rawc.cursor()
+            cursor.execute("select 1")
+            cursor.close()
+            rawc.rollback()
+            return rawc
+        except engine.dialect.dbapi.Error:
+            rawc.invalidate()
+            rawc.close()
+
+            if retry:
+                raise
+            engine.dispose()
+
+
+@contextmanager
+def autocommit_connection(*args, **kwargs):
+    """
+    Args:
+        args: An SQLAlchemy :class:`Engine`, or the same arguments as you'd pass to :func:`C`.
+        kwargs: Same arguments as you'd pass to :func:`C`.
+
+    Check out a raw DBAPI connection in autocommit mode from an engine's pool, for statements that can't run inside a transaction (`vacuum`, `create index concurrently` and so on).
+
+    .. code-block:: python
+
+        with autocommit_connection('postgresql:///databasename') as c:
+            c.cursor().execute('vacuum analyze')
+
+    For URLs, the engine is the cached one shared with :func:`S` and :func:`C`. The connection is checked with `select 1` (and replaced if dead) before being handed out, and is returned to the pool in its usual transactional mode afterwards, so repeated use doesn't pay for a new connection each time.
+    """
+    if args and isinstance(args[0], Engine):
+        engines = _given_engine(args[0])
+    else:
+        engines = _engine_for(*args, **kwargs)
+
+    with engines as engine:
+        rawc = _checkout_healthy(engine)
+        dialect = engine.dialect
+
+        try:
+            dialect.set_isolation_level(rawc.connection, "AUTOCOMMIT")
+            yield rawc.connection
+        finally:
+            try:
+                dialect.reset_isolation_level(rawc.connection)
+            except Exception:
+                rawc.invalidate()
+            rawc.close()
+
+
+def _session_options(kwargs):
+    scope = kwargs.pop("scope", None)
+    read_only = kwargs.pop("read_only", None)
+
+    if "replicas" in kwargs and not kwargs["replicas"]:
+        # everything goes to the primary anyway
+        read_only = None
+    return scope, read_only
+
+
+def _new_session(Session, scope, read_only=None):
+    kwargs = {}
+
+    if read_only is not None:
+        if not issubclass(Session.session_factory.class_, RoutingSession):
+            raise ValueError("read_only requires replicas")
+        kwargs["read_only"] = read_only
+
+    if scope == "thread":
+        return Session(**kwargs)
+    elif scope is None:
+        return Session.session_factory(**kwargs)
+    raise ValueError("scope must be None or 'thread'")
+
+
 def session(*args, **kwargs):
     """
     Returns:
@@ -137,11 +397,29 @@ def session(*args, **kwargs):
     that calling it again with the same parameters will reuse the
     `scoped_session`.
 
+    Each call returns a brand new session, unless you pass `scope='thread'`,
+    in which case each thread gets one session that's reused until
+    `remove()` is called on the `scoped_session`. Either way, nothing
+    accumulates in the `scoped_session` registry, no matter how many
+    sessions are created.
+
+    To send reads to replicas, pass their URLs as `replicas`, along with
+    `read_only` and any of the options of :class:`ReplicaSet
+    <sqlbag.routing.ReplicaSet>`. See :class:`RoutingSession
+    <sqlbag.routing.RoutingSession>` for how reads are detected. If
+    `replicas` is empty, those are ignored and you get a plain session on
+    the primary.
+
+    .. code-block:: python
+
+        s = session(primary_url, replicas=[replica_url], max_lag=5)
+
     :class:`S <S>` creates a session in the same way but in the form of a
     context manager.
     """
+    scope, read_only = _session_options(kwargs)
     Session = get_scoped_session_maker(*args, **kwargs)
-    return Session()
+    return _new_session(Session, scope, read_only)
 
 
 @contextmanager
@@ -157,20 +435,54 @@ def S(*args, **kwargs):
 
     Does `commit()` on close, `rollback()` on exception.
 
-    Also uses `scoped_session` under the hood.
+    Also uses `scoped_session` under the hood. Takes the same `scope` option
+    as :func:`session`; with `scope='thread'` the thread's session is
+    removed from the registry on close.
+
+    Likewise takes `replicas` and `read_only`, to send reads to replicas:
+
+    .. code-block:: python
+
+        with S(primary_url, replicas=[replica_url], read_only=True) as s:
+            s.execute('select 1;')
 
     """
+    scope, read_only = _session_options(kwargs)
     Session = get_scoped_session_maker(*args, **kwargs)
+    session = _new_session(Session, scope, read_only)
 
     try:
-        session = Session()
         yield session
         session.commit()
     except Exception:
         session.rollback()
         raise
     finally:
-        session.close()
+        if scope == "thread":
+            Session.remove()
+        else:
+            session.close()
+
+
+def _freeze(value):
+    # only the plain containers: subclasses (such as URL, a namedtuple) may
+    # hash themselves differently
+    if type(value) is dict:
+        return (dict, frozenset((k, _freeze(v)) for k, v in value.items()))
+    if type(value) in (list, tuple):
+        return (type(value), tuple(_freeze(_) for _ in value))
+    if type(value) in (set, frozenset):
+        return (frozenset, frozenset(_freeze(_) for _ in value))
+    return value
+
+
+def _scoped_session_key(args, kwargs):
+    """
+    A hashable key for these create_engine arguments, with any dicts and lists in them frozen. Raises TypeError if some argument still can't be hashed.
+    """
+    key = (_freeze(args), frozenset((k, _freeze(v)) for k, v in kwargs.items()))
+    hash(key)
+    return key
 
 
 def get_scoped_session_maker(*args, **kwargs):
@@ -178,13 +490,83 @@ def get_scoped_session_maker(*args, **kwargs):
     Creates a scoped session maker, and saves it for reuse next time.
 
     """
+    if "replicas" in kwargs:
+        return _routing_session_maker(*args, **kwargs)
+
+    tup = _scoped_session_key(args, kwargs)
+
+    def create():
+        return scoped_session(sessionmaker(bind=_create_engine(*args, **kwargs)))
+
+    return SCOPED_SESSION_MAKERS.get_or_create(tup, create)
+
+
+def _routing_session_maker(url, *args, **kwargs):
+    replicas = tuple(kwargs.pop("replicas"))
+    options = {k: kwargs.pop(k) for k in ROUTING_OPTIONS if k in kwargs}
+
+    if not replicas:
+        return get_scoped_session_maker(url, *args, **kwargs)
 
-    tup = (args, frozenset(kwargs.items()))
-    if tup not in SCOPED_SESSION_MAKERS:
-        SCOPED_SESSION_MAKERS[tup] = scoped_session(
-            sessionmaker(bind=create_engine(*args, **kwargs)), scopefunc=scopefunc
+    tup = _scoped_session_key(
+        (url,) + args, dict(kwargs, replicas=replicas, **options)
+    )
+
+    def create():
+        # the primary and replica engines are the usual cached ones
+        primary = get_engine(url, *args, **kwargs)
+        engines = [get_engine(_, *args, **kwargs) for _ in replicas]
+
+        return scoped_session(
+            sessionmaker(
+                bind=primary,
+                class_=RoutingSession,
+                replica_set=ReplicaSet(primary, engines, **options),
+            )
         )
-    return SCOPED_SESSION_MAKERS[tup]
+
+    return SCOPED_SESSION_MAKERS.get_or_create(tup, create)
+
+
+def get_engine(*args, **kwargs):
+    """
+    Returns:
+        Engine: The cached SQLAlchemy :class:`Engine` for these create_engine arguments.
+
+    This is the same engine that :func:`S`, :func:`session` and :func:`C` use, so it's subject to the same cache limits (see :func:`configure_session_cache`).
+    """
+    return get_scoped_session_maker(*args, **kwargs).session_factory.kw["bind"].engine
+
+
+def configure_session_cache(maxsize=None, ttl=None):
+    """
+    Args:
+        maxsize(int): Maximum number of engines to keep. Unbounded if None.
+        ttl(float): Dispose of engines that haven't been used for this many seconds. Never if None.
+
+    :func:`S`, :func:`session` and :func:`C` cache an engine (and its connection pool) for each distinct set of arguments they're called with. By default that cache grows without limit, which can leak connections and file descriptors in processes that talk to many databases. This bounds it: least recently used engines are disposed of as necessary.
+
+    The same limits apply to the separate cache of async engines used by :func:`AS` and :func:`AC`.
+
+    The TTL is only checked when the cache is used, so engines aren't disposed of while a process sits idle. To release them anyway (say, from a periodic task in a long-running worker), call `expire()` on each cache in `ENGINE_CACHES`.
+
+    See `SCOPED_SESSION_MAKERS.stats()` for hit, miss and eviction counts.
+    """
+    for cache in ENGINE_CACHES:
+        cache.configure(maxsize=maxsize, ttl=ttl)
+
+
+def _dispose_cached_engines(db_url):
+    # closes pooled connections that have been (or are about to be) killed,
+    # so sessions created afterwards don't get handed a dead connection
+    url = make_url(db_url)
+    server = _admin_url(url)
+
+    for Session in SCOPED_SESSION_MAKERS.values():
+        e = Session.session_factory.kw["bind"].engine
+
+        if e.url.database == url.database and _admin_url(e.url) == server:
+            e.dispose()
 
 
 def raw_connection(s_or_c_or_rawc):
@@ -208,27 +590,205 @@ def raw_execute(s, statements):
     raw_connection(s).cursor().execute(statements)
 
 
-@contextmanager
-def C(*args, **kwargs):
+def stream_query(s_or_c, query, params=None, itersize=1000, batches=False):
     """
-    Hello it's me.
+    Args:
+        s_or_c: SQLAlchemy :class:`Session` or :class:`Connection` to use.
+        query: SQL string or SQLAlchemy selectable.
+        params (dict): Bind parameters for the query.
+        itersize (int): Number of rows to fetch from the server at a time.
+        batches (bool): Yield lists of up to `itersize` rows rather than individual rows.
+
+    Returns:
+        A generator of rows (or batches of rows).
+
+    Read a large result set in constant memory. Uses a server-side cursor where the driver supports it (a named cursor with psycopg2, an unbuffered cursor with pymysql), fetching `itersize` rows at a time.
+
+    The cursor is closed as soon as the generator is exhausted or closed, so if you might stop early, close it explicitly:
+
+    .. code-block:: python
+
+        with contextlib.closing(stream_query(s, 'select * from big')) as rows:
+            for row in rows:
+                ...
+
+    On PostgreSQL, named cursors only live as long as the current transaction.
     """
-    e = create_engine(*args, **kwargs)
-    c = e.connect()
-    trans = c.begin()
+    c = connection_from_s_or_c(s_or_c)
+
+    if isinstance(query, string_types):
+        query = text(query)
+
+    streaming = c.execution_options(stream_results=True, max_row_buffer=itersize)
+    result = streaming.execute(query, params or {})
 
     try:
-        yield c
-        trans.commit()
-    except Exception:
-        trans.rollback()
-        raise
+        if batches:
+            while True:
+                rows = result.fetchmany(itersize)
+
+                if not rows:
+                    break
+                yield rows
+        else:
+            for row in result:
+                yield row
+    finally:
+        result.close()
+
+
+VALUES_PLACEHOLDER = re.compile(r"\bvalues\s+%s", re.IGNORECASE)
+
+PARAMSTYLE_MARKERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+
+
+def _pages(iterable, page_size):
+    it = iter(iterable)
+
+    while True:
+        page = list(itertools.islice(it, page_size))
+
+        if not page:
+            return
+        yield page
+
+
+def _multirow_values(sql, page, marker):
+    row = "({})".format(", ".join([marker] * len(page[0])))
+    m = VALUES_PLACEHOLDER.search(sql)
+
+    statement = "{}values {}{}".format(
+        sql[: m.start()], ", ".join([row] * len(page)), sql[m.end() :]
+    )
+    params = [value for values in page for value in values]
+    return statement, params
+
+
+def execute_batch(s_or_c, sql, params_iter, page_size=100):
+    """
+    Args:
+        s_or_c: SQLAlchemy :class:`Session` or :class:`Connection` to use.
+        sql (str): The statement, with placeholders in the driver's own style.
+        params_iter: An iterable (such as a generator) of parameters, one set per row.
+        page_size (int): Number of rows to send to the server at once.
+
+    Returns:
+        A dict with the number of `rows` and `pages` executed, the `elapsed` time in seconds and the `rows_per_second`.
+
+    Execute a statement for many sets of parameters, a page at a time, which is far faster than executing it row by row. Parameters are read lazily, so memory use is bounded by the page size.
+
+    If the statement contains `values %s`, a single statement with a multi-row VALUES list is sent for each page (using psycopg2's `execute_values` on PostgreSQL), and the parameters must be sequences:
+
+    .. code-block:: python
+
+        execute_batch(s, 'insert into t(a, b) values %s', rows)
+
+    Otherwise each page is sent with psycopg2's `execute_batch` on PostgreSQL, or `executemany` elsewhere.
+
+    Runs in the current transaction of the session or connection.
+    """
+    c = connection_from_s_or_c(s_or_c)
+    dbtype = c.engine.dialect.name
+    values = VALUES_PLACEHOLDER.search(sql)
+
+    if dbtype == "postgresql":
+        from psycopg2 import extras
+    elif values:
+        paramstyle = c.engine.dialect.dbapi.paramstyle
+
+        if paramstyle not in PARAMSTYLE_MARKERS:  # pragma: no cover
+            raise NotImplementedError
+        marker = PARAMSTYLE_MARKERS[paramstyle]
+
+    started = default_timer()
+    rows = 0
+    pages = 0
+
+    cursor = raw_connection(c).cursor()
+
+    try:
+        for page in _pages(params_iter, page_size):
+            if dbtype == "postgresql":
+                if values:
+                    extras.execute_values(cursor, sql, page, page_size=page_size)
+                else:
+                    extras.execute_batch(cursor, sql, page, page_size=page_size)
+            elif values:
+                cursor.execute(*_multirow_values(sql, page, marker))
+            else:
+                cursor.executemany(sql, page)
+
+            rows += len(page)
+            pages += 1
     finally:
-        c.close()
+        cursor.close()
+
+    elapsed = default_timer() - started
+
+    return dict(
+        rows=rows,
+        pages=pages,
+        elapsed=elapsed,
+        rows_per_second=rows / elapsed if elapsed else None,
+    )
 
 
 @contextmanager
-def admin_db_connection(db_url):
+def C(*args, **kwargs):
+    """Boilerplate context manager for creating and using core connections.
+
+    .. code-block:: python
+
+        with C('postgresql:///databasename') as c:
+            c.execute('select 1;')
+
+    Pass in the same parameters as you'd pass to create_engine (including
+    pool options such as `pool_size` and `max_overflow`). The engine is
+    cached and shared with :func:`S` and :func:`session`, so connections
+    come from its pool rather than being opened from scratch each time.
+    Dicts and lists among the arguments (`connect_args`, say) are fine;
+    anything else that can't be hashed gets an engine of its own, disposed
+    of on close.
+
+    Commits on close, rolls back on exception.
+    """
+    with _engine_for(*args, **kwargs) as e:
+        c = e.connect()
+        trans = c.begin()
+
+        try:
+            yield c
+            trans.commit()
+        except Exception:
+            trans.rollback()
+            raise
+        finally:
+            c.close()
+
+
+@contextmanager
+def _given_engine(engine):
+    yield engine
+
+
+@contextmanager
+def _engine_for(*args, **kwargs):
+    try:
+        _scoped_session_key(args, kwargs)
+    except TypeError:
+        # arguments that can't be part of a cache key get an engine of their
+        # own, just for this use
+        e = _create_engine(*args, **kwargs)
+
+        try:
+            yield e
+        finally:
+            e.dispose()
+    else:
+        yield get_engine(*args, **kwargs)
+
+
+def _admin_url(db_url):
     url = make_url(db_url)
     dbtype = url.get_dialect().name
 
@@ -240,8 +800,130 @@ def admin_db_connection(db_url):
 
     elif not dbtype == "sqlite":
         url = alter_url(url, database='')
+    return url
+
+
+def _admin_engine(db_url, pool_size=1):
+    url = _admin_url(db_url)
+    dbtype = url.get_dialect().name
+
+    kwargs = dict(pool_size=pool_size, max_overflow=0)
 
     if dbtype == "postgresql":
+        kwargs["isolation_level"] = "AUTOCOMMIT"
+
+    e = _create_engine(url, **kwargs)
+
+    if dbtype == "mysql":
+
+        @event.listens_for(e, "connect")
+        def ansi_mode(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SET sql_mode = 'ANSI'")
+            cursor.close()
+
+    return e
+
+
+class AdminConnections(object):
+    """
+    Args:
+        pool_size(int): Number of connections to keep open to each server.
+
+    Caches one admin engine per database server, so that while it's active, :func:`admin_db_connection` (and therefore :func:`database_exists`, :func:`create_database`, :func:`drop_database` and friends) reuses pooled connections instead of connecting from scratch every time.
+
+    .. code-block:: python
+
+        with AdminConnections():
+            for url in tenant_urls:
+                create_database(url)
+
+    Use `activate()` instead to keep it active until the process exits. Cached engines are disposed on exit either way.
+    """
+
+    def __init__(self, pool_size=5):
+        self.pool_size = pool_size
+        self.engines = {}
+        self._lock = threading.Lock()
+
+    def engine(self, db_url):
+        """
+        Args:
+            db_url: URL of any database on the server.
+
+        Returns:
+            The cached admin :class:`Engine` for that server, creating it if necessary.
+        """
+        url = _admin_url(db_url)
+
+        with self._lock:
+            if url not in self.engines:
+                self.engines[url] = _admin_engine(url, pool_size=self.pool_size)
+            return self.engines[url]
+
+    def activate(self):
+        if self not in ADMIN_CONNECTIONS:
+            ADMIN_CONNECTIONS.append(self)
+        return self
+
+    def deactivate(self):
+        if self in ADMIN_CONNECTIONS:
+            ADMIN_CONNECTIONS.remove(self)
+
+    def dispose(self):
+        """
+        Close all the cached engines' connections.
+        """
+        with self._lock:
+            for e in self.engines.values():
+                e.dispose()
+            self.engines.clear()
+
+    def __enter__(self):
+        return self.activate()
+
+    def __exit__(self, *exc):
+        self.deactivate()
+        self.dispose()
+
+
+def active_admin_connections():
+    """
+    Returns:
+        The most recently activated :class:`AdminConnections`, or None.
+    """
+    if ADMIN_CONNECTIONS:
+        return ADMIN_CONNECTIONS[-1]
+
+
+@atexit.register
+def _dispose_admin_connections():
+    for admin in list(ADMIN_CONNECTIONS):
+        admin.deactivate()
+        admin.dispose()
+
+
+@contextmanager
+def admin_db_connection(db_url):
+    url = _admin_url(db_url)
+    dbtype = url.get_dialect().name
+
+    admin = active_admin_connections()
+
+    if admin and dbtype != "sqlite":
+        c = admin.engine(url).connect()
+        trans = c.begin()
+
+        try:
+            yield c
+            trans.commit()
+        except Exception:
+            trans.rollback()
+            raise
+        finally:
+            c.close()
+
+    elif dbtype == "postgresql":
         with C(url, poolclass=NullPool, isolation_level="AUTOCOMMIT") as c:
             yield c
 
@@ -286,19 +968,122 @@ def _killquery(dbtype, dbname, hardkill):
     return sql
 
 
-def kill_other_connections(s_or_c, dbname=None, hardkill=False):
+def _kill_mysql_connections(c, pids):
+    killed = []
+
+    for pid in pids:
+        kill = text("kill connection :pid")
+
+        try:
+            c.execute(kill, pid=pid)
+            killed.append(pid)
+        except DB_ERROR_TUPLE as e:  # pragma: no cover
+            code, message = e.orig.args
+            if "Unknown thread id" in message:
+                pass
+            else:
+                raise
+    return killed
+
+
+def _activity(c, dbtype, dbname):
+    if dbtype == "postgresql":
+        # pg_stat_activity is otherwise fixed for the rest of the transaction
+        c.execute("select pg_stat_clear_snapshot()")
+        sql = PG_ACTIVITY
+
+        if dbname:
+            sql += " and datname = :databasename"
+    elif dbtype == "mysql":
+        sql = MYSQL_ACTIVITY
+
+        if dbname:
+            sql += " and DB = :databasename"
+    else:
+        raise NotImplementedError
+
+    if dbname:
+        rows = c.execute(text(sql), databasename=dbname)
+    else:  # pragma: no cover
+        rows = c.execute(text(sql))
+    return dict((row.process_id, bool(row.active)) for row in rows)
+
+
+def _drain_connections(c, dbname, timeout, poll_interval, keep_closed):
+    dbtype = c.engine.dialect.name
+    started = default_timer()
+    revoked = False
+
+    if dbname and dbtype == "postgresql":
+        row = c.execute(text(PG_PUBLIC_CONNECT), databasename=dbname).first()
+
+        if row and row.public_connect and row.owned:
+            quoted = c.dialect.identifier_preparer.quote(dbname)
+            c.execute("revoke connect on database {} from public".format(quoted))
+            revoked = True
+
+    try:
+        return _drain(c, dbtype, dbname, started, timeout, poll_interval)
+    finally:
+        if revoked and not keep_closed:
+            c.execute("grant connect on database {} to public".format(quoted))
+
+
+def _drain(c, dbtype, dbname, started, timeout, poll_interval):
+    activity = _activity(c, dbtype, dbname)
+    waited_on = sorted(pid for pid, active in activity.items() if active)
+
+    while any(activity.values()) and default_timer() - started < timeout:
+        time.sleep(poll_interval)
+        activity = _activity(c, dbtype, dbname)
+
+    stragglers = sorted(activity)
+
+    if not stragglers:
+        killed = []
+    elif dbtype == "postgresql":
+        rows = c.execute(text(PG_TERMINATE), pids=stragglers)
+        killed = sorted(row.process_id for row in rows)
+    else:
+        killed = _kill_mysql_connections(c, stragglers)
+
+    return dict(
+        waited_on=waited_on,
+        finished=[pid for pid in waited_on if not activity.get(pid)],
+        killed=killed,
+        elapsed=default_timer() - started,
+    )
+
+
+def kill_other_connections(
+    s_or_c,
+    dbname=None,
+    hardkill=False,
+    drain_timeout=None,
+    poll_interval=0.1,
+    keep_closed=False,
+):
     """
     Args:
         s_or_c: SQLAlchemy Session or Connection. Needs to have the appropriate permssions to kill connections. For best results use :class:`admin_db_connection`.
         dbname: Name of database. If `None`, kills connections to all databases on the server.
+        hardkill: Also kill connections that are in the middle of something, rather than just idle ones.
+        drain_timeout: If set, drain connections gracefully instead: stop new connections to the database (on PostgreSQL, by revoking connect from public, if it's granted and this role owns the database), wait up to this many seconds for active connections to go idle, then kill everything that's left in one go. Connect is granted back afterwards.
+        poll_interval: How often to check on active connections while draining, in seconds.
+        keep_closed: When draining, leave connect revoked afterwards, say because the database is about to be dropped.
 
     Returns:
-        None
+        None, or when draining, a report dict with the ids of the connections `waited_on` and those which `finished` in time, the ids `killed`, and the `elapsed` time in seconds.
 
     Kill other connections to this database (or entire database server).
     """
     c = connection_from_s_or_c(s_or_c)
 
+    if drain_timeout is not None:
+        return _drain_connections(
+            c, dbname, drain_timeout, poll_interval, keep_closed
+        )
+
     dbtype = c.engine.dialect.name
 
     killquery = _killquery(dbtype, dbname=dbname, hardkill=hardkill)
@@ -309,14 +1094,4 @@ def kill_other_connections(s_or_c, dbname=None, hardkill=False):
         results = c.execute(text(killquery))
 
     if dbtype == "mysql":
-        for x in results:
-            kill = text("kill connection :pid")
-
-            try:
-                c.execute(kill, pid=x.process_id)
-            except DB_ERROR_TUPLE as e:  # pragma: no cover
-                code, message = e.orig.args
-                if "Unknown thread id" in message:
-                    pass
-                else:
-                    raise
+        _kill_mysql_connections(c, [x.process_id for x in results])
@@ -0,0 +1,208 @@
+"""Asyncio counterparts to S, C, session and raw_execute.
+
+Requires SQLAlchemy 1.4 or later, and an async driver such as asyncpg or
+aiosqlite (eg 'postgresql+asyncpg:///databasename').
+"""
+
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from .sqla import ENGINE_CACHES, ENGINE_HOOKS, LRUCache, _scoped_session_key
+
+_DISPOSALS = set()
+
+# the event loop each engine was created in, as its pool only works there
+_ENGINE_LOOPS = weakref.WeakKeyDictionary()
+
+# async generators that dispose of each engine when its loop shuts down
+_CLOSERS = weakref.WeakKeyDictionary()
+
+_CLOSED = weakref.WeakSet()
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _engine_loop(engine):
+    ref = _ENGINE_LOOPS.get(engine)
+    return ref and ref()
+
+
+def _dispose(engine, loop):
+    if loop is None:
+        asyncio.run(engine.dispose())
+    else:
+        task = loop.create_task(engine.dispose())
+        _DISPOSALS.add(task)
+        task.add_done_callback(_DISPOSALS.discard)
+
+
+def _dispose_async_engine(key, engine):
+    if engine in _CLOSED:
+        return
+
+    running = _running_loop()
+    loop = _engine_loop(engine)
+
+    if key[0] is None:
+        # created outside any loop, so not tied to one
+        _dispose(engine, running)
+    elif loop is not None and loop is running:
+        _dispose(engine, loop)
+    else:
+        # its loop has closed (or isn't this thread's), so the connections
+        # can't be closed from here: just let go of the pool
+        engine.sync_engine.dispose(close=False)
+
+
+ASYNC_ENGINES = LRUCache(on_evict=_dispose_async_engine)
+
+ENGINE_CACHES.append(ASYNC_ENGINES)
+
+
+async def _close_with_loop(key, engine_ref):
+    # asyncio.run() (like any loop owner that calls shutdown_asyncgens())
+    # closes this before closing the loop, while connections can still be
+    # closed properly
+    try:
+        yield
+    finally:
+        engine = engine_ref()
+
+        if engine is not None:
+            _CLOSED.add(engine)
+
+            if dict(ASYNC_ENGINES.items()).get(key) is engine:
+                ASYNC_ENGINES.discard(key)
+            await engine.dispose()
+
+
+def _expire_closed_loops():
+    for key, engine in ASYNC_ENGINES.items():
+        if key[0] is not None:
+            loop = _engine_loop(engine)
+
+            if loop is None or loop.is_closed():
+                ASYNC_ENGINES.discard(key)
+
+
+def get_async_engine(*args, **kwargs):
+    """
+    Returns:
+        AsyncEngine: The cached SQLAlchemy :class:`AsyncEngine` for these create_async_engine arguments, creating it if necessary.
+
+    Cached the same way as the engines used by :func:`S` and :func:`C`, except that each event loop gets its own engine, since async drivers' connections can only be used in the loop that created them. Each loop's engines are disposed of when it shuts down (as at the end of `asyncio.run()`), and any belonging to loops that closed without shutting down are discarded on the next call.
+    """
+    _expire_closed_loops()
+
+    loop = _running_loop()
+    key = (loop and id(loop), _scoped_session_key(args, kwargs))
+
+    def create():
+        e = create_async_engine(*args, **kwargs)
+
+        if loop is not None:
+            _ENGINE_LOOPS[e] = weakref.ref(loop)
+            _CLOSERS[e] = closer = _close_with_loop(key, weakref.ref(e))
+            asyncio.ensure_future(closer.__anext__())
+
+        for hook in ENGINE_HOOKS:
+            hook(e.sync_engine)
+        return e
+
+    e = ASYNC_ENGINES.get_or_create(key, create)
+
+    if _engine_loop(e) is not loop:
+        # a previous loop with the same id, since garbage collected
+        ASYNC_ENGINES.discard(key)
+        e = ASYNC_ENGINES.get_or_create(key, create)
+    return e
+
+
+def async_session(*args, **kwargs):
+    """
+    Returns:
+        AsyncSession: A new SQLAlchemy :class:`AsyncSession`, bound to the cached engine for these arguments.
+
+    The async version of :func:`session`.
+    """
+    return AsyncSession(bind=get_async_engine(*args, **kwargs))
+
+
+@asynccontextmanager
+async def AS(*args, **kwargs):
+    """Async version of :func:`S`.
+
+    .. code-block:: python
+
+        async with AS('postgresql+asyncpg:///databasename') as s:
+            await s.execute(text('select 1'))
+
+    Does `commit()` on close, `rollback()` on exception.
+    """
+    session = async_session(*args, **kwargs)
+
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+@asynccontextmanager
+async def AC(*args, **kwargs):
+    """Async version of :func:`C`.
+
+    .. code-block:: python
+
+        async with AC('postgresql+asyncpg:///databasename') as c:
+            await c.execute(text('select 1'))
+
+    Commits on close, rolls back on exception.
+    """
+    e = get_async_engine(*args, **kwargs)
+
+    async with e.connect() as c:
+        trans = await c.begin()
+
+        try:
+            yield c
+            await trans.commit()
+        except Exception:
+            await trans.rollback()
+            raise
+
+
+async def async_connection_from_s_or_c(s_or_c):
+    """
+    Args:
+        s_or_c: Either an :class:`AsyncSession` or an :class:`AsyncConnection`.
+
+    Returns:
+        AsyncConnection: The connection itself, or the one the session is using.
+    """
+    if isinstance(s_or_c, AsyncSession):
+        return await s_or_c.connection()
+    return s_or_c
+
+
+async def async_raw_execute(s_or_c, statement):
+    """
+    Args:
+        s_or_c: Either an :class:`AsyncSession` or an :class:`AsyncConnection`.
+        statement (str): SQL to pass to the driver as is.
+
+    Async version of :func:`raw_execute`. Unlike psycopg2, async drivers generally accept just one statement at a time.
+    """
+    c = await async_connection_from_s_or_c(s_or_c)
+    await c.exec_driver_sql(statement)
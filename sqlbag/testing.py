@@ -0,0 +1,254 @@
+"""Helpers for keeping tests that share a database isolated from each other."""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+
+from .sqla import (
+    SCOPED_SESSION_MAKERS,
+    _scoped_session_key,
+    get_scoped_session_maker,
+)
+
+IDENTIFIER = r'(?:"(?:[^"]|"")+"|`[^`]+`|[\w$]+)'
+
+# string literals and comments, which could otherwise hide or fake a write
+LITERALS_AND_COMMENTS = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+WRITE_STATEMENT = re.compile(
+    r"(?:^|[();])\s*(?:insert\s+(?:ignore\s+)?into|replace\s+into|update|delete\s+from)"
+    r"\s+(?:only\s+)?({0}(?:\s*\.\s*{0})?)".format(IDENTIFIER),
+    re.IGNORECASE,
+)
+
+
+def _unquote(identifier, fold_case):
+    if identifier[0] == '"':
+        return identifier[1:-1].replace('""', '"')
+    elif identifier[0] == "`":
+        return identifier[1:-1]
+    elif fold_case:
+        return identifier.lower()
+    return identifier
+
+
+def _blank(m):
+    return "''" if m.group().startswith("'") else " "
+
+
+def written_tables(statement, fold_case=False):
+    """
+    Args:
+        statement (str): An SQL statement, or several separated by semicolons.
+        fold_case (bool): Lowercase unquoted identifiers, as PostgreSQL does.
+
+    Returns:
+        tables (list): The (schema, table) pairs the statement inserts into, updates or deletes from. schema is None if not specified.
+    """
+    tables = []
+    statement = LITERALS_AND_COMMENTS.sub(_blank, statement)
+
+    for m in WRITE_STATEMENT.finditer(statement):
+        parts = re.findall(IDENTIFIER, m.group(1))
+        parts = [_unquote(_, fold_case) for _ in parts]
+
+        if len(parts) == 1:
+            parts = [None] + parts
+        tables.append(tuple(parts))
+    return tables
+
+
+class TableTracker(object):
+    """
+    Args:
+        engine: The SQLAlchemy :class:`Engine` to watch.
+
+    Records which tables are written to through an engine, so that just those tables can be cleared afterwards with `reset()`. This makes per-test cleanup cost proportional to what each test touched, rather than to the size of the schema.
+
+    Statements are seen via the engine's `before_cursor_execute` event, so anything executed directly on a DBAPI cursor (such as with :func:`raw_execute`) isn't tracked.
+
+    Usually created with :func:`track_writes`.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.tables = set()
+        self.attached = False
+        self.attach()
+
+    def _before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        fold_case = conn.dialect.name == "postgresql"
+        self.tables.update(written_tables(statement, fold_case=fold_case))
+
+    def attach(self):
+        if not self.attached:
+            event.listen(
+                self.engine, "before_cursor_execute", self._before_cursor_execute
+            )
+            self.attached = True
+
+    def detach(self):
+        if self.attached:
+            event.remove(
+                self.engine, "before_cursor_execute", self._before_cursor_execute
+            )
+            self.attached = False
+
+    def reset(self):
+        """
+        Returns:
+            tables (list): The (schema, table) pairs that were cleared.
+
+        Clear every table written to since the tracker was created (or last reset). On PostgreSQL this is a single `truncate ... restart identity cascade`. On SQLite and MySQL each table is emptied with a `delete`, and autoincrement counters are reset.
+        """
+        with self.engine.connect() as c:
+            trans = c.begin()
+
+            try:
+                tables = _clear_tables(c, self.tables)
+                trans.commit()
+            except Exception:
+                trans.rollback()
+                raise
+
+        self.tables.clear()
+        return tables
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.reset()
+        finally:
+            self.detach()
+
+
+def _clear_tables(c, tables):
+    dialect = c.dialect
+    quote = dialect.identifier_preparer.quote
+
+    tables = sorted(
+        (t for t in tables if dialect.has_table(c, t[1], schema=t[0])),
+        key=lambda t: (t[0] or "", t[1]),
+    )
+
+    if not tables:
+        return tables
+
+    def qualified(t):
+        schema, name = t
+
+        if schema:
+            return "{}.{}".format(quote(schema), quote(name))
+        return quote(name)
+
+    if dialect.name == "postgresql":
+        c.execute(
+            "truncate {} restart identity cascade".format(
+                ", ".join(qualified(t) for t in tables)
+            )
+        )
+    elif dialect.name == "mysql":
+        c.execute("SET FOREIGN_KEY_CHECKS = 0")
+
+        try:
+            for t in tables:
+                c.execute("delete from {}".format(qualified(t)))
+                c.execute("alter table {} auto_increment = 1".format(qualified(t)))
+        finally:
+            c.execute("SET FOREIGN_KEY_CHECKS = 1")
+    else:
+        for t in tables:
+            c.execute("delete from {}".format(qualified(t)))
+
+        if dialect.name == "sqlite" and dialect.has_table(c, "sqlite_sequence"):
+            for schema, name in tables:
+                c.execute(
+                    "delete from {}sqlite_sequence where name = ?".format(
+                        schema and quote(schema) + "." or ""
+                    ),
+                    (name,),
+                )
+    return tables
+
+
+def track_writes(*args, **kwargs):
+    """
+    Args:
+        args: Same arguments as you'd pass to :func:`S` or :func:`session`.
+        kwargs: Same arguments as you'd pass to :func:`S` or :func:`session`.
+
+    Returns:
+        A :class:`TableTracker` watching the engine that :func:`S` and :func:`session` use for these arguments.
+
+    .. code-block:: python
+
+        with track_writes(db_url):
+            with S(db_url) as s:
+                s.execute('insert into t values (1)')
+
+        # t is empty again
+    """
+    Session = get_scoped_session_maker(*args, **kwargs)
+    return TableTracker(Session.session_factory.kw["bind"])
+
+
+class _SavepointSession(Session):
+    def __init__(self, *args, **kwargs):
+        super(_SavepointSession, self).__init__(*args, **kwargs)
+        self.begin_nested()
+
+
+def _restart_savepoint(session, transaction):
+    if transaction.nested and not transaction._parent.nested:
+        session.expire_all()
+        session.begin_nested()
+
+
+@contextmanager
+def isolated_transaction(*args, **kwargs):
+    """
+    Args:
+        args: Same arguments as you'd pass to :func:`S` or :func:`session`.
+        kwargs: Same arguments as you'd pass to :func:`S` or :func:`session`.
+
+    Returns:
+        connection: The :class:`Connection` that sessions are bound to.
+
+    Opens a single connection and transaction, and for the duration of the context manager scope, binds every session that :func:`S` or :func:`session` creates with these arguments to it. Each session works inside a SAVEPOINT, which is restarted whenever the session commits or rolls back, and the outer transaction is rolled back at the end. So nothing the code under test does persists, even if it calls `commit()`.
+
+    This lets many tests share one database with next to no setup cost each.
+
+    .. code-block:: python
+
+        with isolated_transaction(db_url):
+            with S(db_url) as s:
+                s.execute('insert into t values (1)')
+
+        # t is unchanged
+    """
+    key = _scoped_session_key(args, kwargs)
+    original = get_scoped_session_maker(*args, **kwargs)
+    engine = original.session_factory.kw["bind"]
+
+    c = engine.connect()
+    trans = c.begin()
+
+    bound = sessionmaker(bind=c, class_=_SavepointSession)
+    event.listen(bound, "after_transaction_end", _restart_savepoint)
+
+    SCOPED_SESSION_MAKERS[key] = scoped_session(bound)
+
+    try:
+        yield c
+    finally:
+        SCOPED_SESSION_MAKERS[key] = original
+        trans.rollback()
+        c.close()
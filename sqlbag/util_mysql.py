@@ -8,3 +8,13 @@ MYSQL_KILLQUERY_FORMAT = """
     where
         ID != connection_id()
 """
+
+MYSQL_ACTIVITY = """
+    select
+        ID as process_id,
+        COMMAND != 'Sleep' as active
+    from
+        information_schema.processlist
+    where
+        ID != connection_id()
+"""
@@ -43,3 +43,37 @@ PSQL_KILLQUERY_FORMAT_INCLUDING_DROPPED = """
         psa
     where psa.pid != pg_backend_pid()
 """
+
+PSQL_ACTIVITY_INCLUDING_DROPPED = """
+    with psa as (
+        SELECT
+            *,
+            (select datname from pg_database d where d.oid = s.datid)
+                as datname
+        FROM pg_stat_get_activity(NULL::integer) s
+    )
+    select
+        psa.pid as process_id,
+        psa.state != 'idle' as active
+    from
+        psa
+    where psa.pid != pg_backend_pid()
+"""
+
+PSQL_TERMINATE_PIDS = """
+    select
+        pid as process_id
+    from
+        unnest(:pids) pid
+    where pg_terminate_backend(pid)
+"""
+
+# whether connect is granted to public, and we're able to take it away
+PSQL_PUBLIC_CONNECT = """
+    select
+        has_database_privilege('public', datname, 'CONNECT') as public_connect,
+        pg_has_role(datdba, 'USAGE') as owned
+    from
+        pg_database
+    where datname = :databasename
+"""
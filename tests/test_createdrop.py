@@ -1,12 +1,32 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+from datetime import timedelta
+from timeit import default_timer
+
+from pytest import raises
+from sqlalchemy.exc import ProgrammingError
+
 from sqlbag import (
+    AdminConnections,
     S,
+    active_admin_connections,
+    collect_temporary_databases,
     create_database,
+    create_databases,
     database_exists,
     drop_database,
+    drop_databases,
+    restore_database,
+    snapshot_database,
     temporary_database,
 )
+from sqlbag.createdrop import _existing_databases
+from sqlbag.sqla import (
+    admin_db_connection,
+    alter_url,
+    copy_url,
+    kill_other_connections,
+)
 
 
 def exists(db_url):
@@ -60,3 +80,256 @@ def test_createdrop(tmpdir):
     with temporary_database("sqlite") as dburi:
         with S(dburi) as s:
             s.execute("select 1")
+
+
+def test_bulk_createdrop(tmpdir):
+    sqlite_url = "sqlite:///" + str(tmpdir / "bulk.db")
+    urls = ["postgresql:///sqlbag_testonly_bulk_{}".format(i) for i in range(5)]
+
+    drop_databases(urls)
+    assert create_database(urls[0])
+
+    results = create_databases(urls + [sqlite_url], max_workers=3)
+    assert list(results) == urls + [sqlite_url]
+    assert list(results.values()) == [False, True, True, True, True, True]
+
+    for db_url in urls:
+        assert exists(db_url)
+
+    results = create_databases(urls[:2], template="template_nonexistent")
+    assert list(results.values()) == [False, False]
+
+    results = drop_databases(urls[1:] + [sqlite_url])
+    assert all(results.values())
+
+    results = drop_databases(urls)
+    assert list(results.values()) == [True, False, False, False, False]
+
+    for db_url in urls:
+        assert not exists(db_url)
+
+    results = create_databases(urls[:1], template="template_nonexistent")
+    assert isinstance(results[urls[0]], ProgrammingError)
+    assert not exists(urls[0])
+
+
+def test_admin_connections():
+    db_url = "postgresql:///sqlbag_testonly_admin"
+
+    with AdminConnections(pool_size=2) as admin:
+        assert active_admin_connections() is admin
+
+        drop_database(db_url)
+        assert create_database(db_url)
+        assert exists(db_url)
+        assert drop_databases([db_url]) == {db_url: True}
+        assert not exists(db_url)
+
+        assert len(admin.engines) == 1
+        e = list(admin.engines.values())[0]
+        assert e.pool.checkedin() == 1
+
+        # more workers than pooled connections
+        urls = ["postgresql:///sqlbag_testonly_admin_{}".format(i) for i in range(4)]
+        assert all(create_databases(urls, max_workers=8).values())
+        assert all(drop_databases(urls, max_workers=8).values())
+        assert e.pool.checkedin() == 2
+
+    with admin_db_connection("sqlite://") as c, raises(NotImplementedError):
+        _existing_databases(c, ["x"])
+
+    assert active_admin_connections() is None
+    assert admin.engines == {}
+
+
+def migrate(db_url, tables=20, rows=2000):
+    with S(db_url) as s:
+        for i in range(tables):
+            s.execute(
+                "create table t{0}(id serial primary key, name text unique)".format(i)
+            )
+            s.execute(
+                "insert into t{0}(name) select 'x' || g "
+                "from generate_series(1, {1}) g".format(i, rows)
+            )
+
+
+def count(db_url):
+    with S(db_url) as s:
+        return s.execute("select count(*) from t0").scalar()
+
+
+def test_snapshot_restore():
+    with raises(NotImplementedError):
+        snapshot_database("sqlite://")
+
+    with temporary_database() as db_url:
+        migrate(db_url, tables=1, rows=3)
+        snapshot = snapshot_database(db_url)
+        snapshot_url = alter_url(db_url, database=snapshot)
+
+        try:
+            with S(db_url) as s:
+                s.execute("delete from t0")
+
+            assert count(db_url) == 0
+            restore_database(db_url, snapshot)
+            assert count(db_url) == 3
+
+            with S(db_url) as s:
+                s.execute("insert into t0(name) values ('y')")
+
+            restore_database(db_url, snapshot, keep_snapshot=False)
+            assert count(db_url) == 3
+            assert not database_exists(snapshot_url)
+        finally:
+            drop_database(snapshot_url)
+
+
+def test_snapshot_restore_access():
+    ACCESS = """
+        select
+            pg_get_userbyid(datdba),
+            has_database_privilege('public', datname, 'connect'),
+            has_database_privilege('public', datname, 'temp')
+        from pg_database where datname = %s
+    """
+
+    def access(c, name):
+        return tuple(c.execute(ACCESS, (name,)).first())
+
+    with temporary_database() as db_url:
+        name = copy_url(db_url).database
+        expected = ("sqlbag_snapshot_owner", True, False)
+
+        with admin_db_connection(db_url) as c:
+            c.execute("create role sqlbag_snapshot_owner")
+
+        try:
+            with admin_db_connection(db_url) as c:
+                c.execute(
+                    'alter database "{}" owner to sqlbag_snapshot_owner'.format(name)
+                )
+                c.execute('revoke temp on database "{}" from public'.format(name))
+
+            snapshot = snapshot_database(db_url)
+
+            with admin_db_connection(db_url) as c:
+                assert access(c, snapshot) == expected
+
+            restore_database(db_url, snapshot)
+
+            with admin_db_connection(db_url) as c:
+                assert access(c, name) == expected
+
+            restore_database(db_url, snapshot, keep_snapshot=False)
+
+            with admin_db_connection(db_url) as c:
+                assert access(c, name) == expected
+        finally:
+            with admin_db_connection(db_url) as c:
+                c.execute("reassign owned by sqlbag_snapshot_owner to current_user")
+                c.execute("drop owned by sqlbag_snapshot_owner")
+                c.execute("drop role sqlbag_snapshot_owner")
+
+
+def test_snapshot_restore_benchmark():
+    # resetting from a snapshot should beat recreating and re-migrating
+    n = 3
+
+    with temporary_database() as db_url:
+        migrate(db_url)
+        snapshot = snapshot_database(db_url)
+
+        try:
+            started = default_timer()
+
+            for _ in range(n):
+                restore_database(db_url, snapshot)
+                assert count(db_url) == 2000
+
+            restore_time = default_timer() - started
+
+            started = default_timer()
+
+            for _ in range(n):
+                drop_database(db_url)
+                create_database(db_url)
+                migrate(db_url)
+                assert count(db_url) == 2000
+
+            recreate_time = default_timer() - started
+        finally:
+            drop_database(alter_url(db_url, database=snapshot))
+
+    print(
+        "restore: {:.3f}s, recreate and migrate: {:.3f}s".format(
+            restore_time / n, recreate_time / n
+        )
+    )
+    assert restore_time < recreate_time
+
+
+def test_collect_temporary_databases():
+    prefix = "sqlbag_leaktest_"
+    urls = ["postgresql:///{}{}".format(prefix, i) for i in range(3)]
+    create_databases(urls)
+
+    try:
+        results = collect_temporary_databases(urls[0], prefix=prefix, dry_run=True)
+        assert results == {prefix + "0": None, prefix + "1": None, prefix + "2": None}
+
+        assert collect_temporary_databases(urls[0], prefix=prefix, owner="nobody") == {}
+        assert (
+            collect_temporary_databases(
+                urls[0], prefix=prefix, older_than=timedelta(days=1)
+            )
+            == {}
+        )
+
+        with S(urls[1]) as s:
+            s.execute("select 1")
+
+        results = collect_temporary_databases(
+            "postgresql:///", prefix=prefix, older_than=timedelta(0), max_workers=2
+        )
+        assert results == {prefix + "0": True, prefix + "1": True, prefix + "2": True}
+
+        for db_url in urls:
+            assert not exists(db_url)
+    finally:
+        drop_databases(urls)
+
+
+def test_temporary_database_templates(tmpdir):
+    with temporary_database("sqlite", memory=True) as seeded:
+        with S(seeded) as s:
+            s.execute("create table t(id int)")
+            s.execute("insert into t values (1)")
+
+        for _ in range(2):
+            with temporary_database("sqlite", memory=True, template=seeded) as url:
+                assert url != seeded
+
+                with S(url) as s:
+                    assert s.execute("select count(*) from t").scalar() == 1
+                    s.execute("insert into t values (2)")
+
+        with temporary_database(
+            "sqlite", template=seeded, directory=str(tmpdir)
+        ) as url:
+            assert url.startswith("sqlite:///" + str(tmpdir))
+
+            with S(url) as s:
+                assert s.execute("select count(*) from t").scalar() == 1
+
+    with temporary_database() as pg_template:
+        with S(pg_template) as s:
+            s.execute("create table t(id int)")
+
+        with admin_db_connection(pg_template) as c:
+            kill_other_connections(c, copy_url(pg_template).database, hardkill=True)
+
+        with temporary_database(template=copy_url(pg_template).database) as url:
+            with S(url) as s:
+                assert s.execute("select count(*) from t").scalar() == 0
@@ -0,0 +1,98 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+
+from pytest import raises
+
+from sqlbag import S, TemporaryDatabasePool, database_exists
+
+
+def setup_template(url):
+    with S(url) as s:
+        s.execute("create table t(id int)")
+        s.execute("insert into t values (1)")
+
+
+def test_dbpool():
+    with raises(NotImplementedError):
+        TemporaryDatabasePool(dialect="sqlite")
+
+    with TemporaryDatabasePool(setup=setup_template, size=2) as pool:
+        template_url = pool.template_url
+
+        with pool.database() as url:
+            assert url != template_url
+
+            with S(url) as s:
+                assert s.execute("select id from t").scalar() == 1
+                s.execute("insert into t values (2)")
+
+        url2 = pool.acquire(timeout=30)
+
+        with S(url2) as s:
+            assert s.execute("select count(*) from t").scalar() == 1
+
+        pool.release(url2)
+
+        # only databases the pool handed out can be released (and dropped)
+        for other in (url2, template_url):
+            with raises(ValueError):
+                pool.release(other)
+
+        assert database_exists(template_url)
+
+        stats = pool.stats()
+        assert stats["hits"] + stats["misses"] == 2
+        assert stats["created"] >= 2
+        assert stats["max_wait"] >= stats["mean_wait"] >= 0
+
+    assert not database_exists(url)
+    assert not database_exists(url2)
+    assert not database_exists(template_url)
+
+    with raises(RuntimeError):
+        pool.acquire(timeout=0)
+
+
+def temporary_databases(prefix):
+    with S("postgresql:///postgres") as s:
+        return s.execute(
+            "select datname from pg_database where datname like :p",
+            dict(p=prefix + "%"),
+        ).fetchall()
+
+
+def test_dbpool_failed_setup():
+    def failing_setup(url):
+        setup_template(url)
+        raise ValueError("migration failed")
+
+    pool = TemporaryDatabasePool(setup=failing_setup, prefix="sqlbag_probe_")
+
+    with raises(ValueError):
+        pool.start()
+
+    pool.close()
+    assert temporary_databases("sqlbag_probe_") == []
+
+
+def test_dbpool_stats_during_setup():
+    started = threading.Event()
+    finish = threading.Event()
+
+    def slow_setup(url):
+        started.set()
+        finish.wait(30)
+
+    pool = TemporaryDatabasePool(setup=slow_setup, size=1)
+    t = threading.Thread(target=pool.start)
+    t.start()
+
+    try:
+        assert started.wait(30)
+        # not blocked by the setup still running
+        assert pool.stats()["ready"] == 0
+    finally:
+        finish.set()
+        t.join()
+        pool.close()
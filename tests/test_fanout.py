@@ -0,0 +1,79 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from sqlbag import S, alter_url, fan_out, temporary_database
+
+
+def test_fan_out():
+    with temporary_database() as a, temporary_database() as b:
+        urls = [a, b]
+
+        for url in urls:
+            with S(url) as s:
+                s.execute("create table t(id int)")
+                s.execute("insert into t values (1)")
+
+        results = {r.url: r for r in fan_out(urls, "select current_database()")}
+
+        assert set(results) == set(urls)
+
+        for url, r in results.items():
+            assert r.error is None
+            assert r.result[0][0] == alter_url(url).database
+            assert r.elapsed >= 0
+
+        results = list(
+            fan_out(urls, "insert into t values (:x)", params=dict(x=2), max_workers=1)
+        )
+        assert [r.result for r in results] == [1, 1]
+
+        def count(s):
+            return s.execute("select count(*) from t").scalar()
+
+        results = list(fan_out(urls, count))
+        assert [r.result for r in results] == [2, 2]
+
+        # failures are reported, not raised, and don't affect the others
+        def fail_on_b(s):
+            s.execute("insert into t values (3)")
+
+            if s.bind.url.database == alter_url(b).database:
+                s.execute("select * from nonexistent")
+
+        results = {r.url: r for r in fan_out(urls, fail_on_b)}
+        assert results[a].error is None
+        assert results[b].error is not None
+
+        assert {r.url: r.result for r in fan_out(urls, count)} == {a: 3, b: 2}
+
+        # per-database timeouts, finishing in parallel
+        started = time.time()
+        results = list(fan_out(urls, "select pg_sleep(10)", timeout=0.5))
+        assert time.time() - started < 5
+
+        for r in results:
+            assert isinstance(r.error, OperationalError)
+            assert "canceling statement" in str(r.error)
+
+        # the timeout covers the whole of each database's work, not just
+        # each statement
+        def sleeps(s):
+            for _ in range(4):
+                s.execute("select pg_sleep(0.4)")
+
+        started = time.time()
+        results = list(fan_out(urls, sleeps, timeout=1))
+        assert time.time() - started < 1.5
+
+        for r in results:
+            assert isinstance(r.error, OperationalError)
+            assert "canceling statement" in str(r.error)
+
+        # the connections are still usable afterwards
+        assert {r.url: r.result for r in fan_out(urls, count)} == {a: 3, b: 2}
+
+    results = list(fan_out(["sqlite://"], "select 1", timeout=1))
+    assert isinstance(results[0].error, NotImplementedError)
@@ -0,0 +1,51 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import subprocess
+import sys
+
+from pytest import raises
+
+import sqlbag
+
+HEAVY = ["sqlalchemy", "psycopg2", "pendulum", "dateutil", "packaging"]
+
+
+def run(code):
+    out = subprocess.check_output([sys.executable, "-c", code])
+    return out.decode("utf-8").strip()
+
+
+def loaded_after(statement):
+    return run(
+        "import sys; {}; print(' '.join(m for m in {!r} if m in sys.modules))".format(
+            statement, HEAVY
+        )
+    ).split()
+
+
+def import_time(statement, repeat=3):
+    code = "from timeit import default_timer as t; s = t(); {}; print(t() - s)"
+    return min(float(run(code.format(statement))) for _ in range(repeat))
+
+
+def test_lazy_imports():
+    assert loaded_after("import sqlbag") == []
+    assert loaded_after("from sqlbag import S") == ["sqlalchemy"]
+
+    for name in sqlbag.__all__:
+        assert getattr(sqlbag, name) is not None
+        assert name in dir(sqlbag)
+
+    assert sqlbag.S is sqlbag.sqla.S
+    assert sqlbag.pg is sys.modules["sqlbag.pg"]
+
+    with raises(AttributeError):
+        sqlbag.nonexistent
+
+
+def test_import_time():
+    lazy = import_time("import sqlbag")
+    eager = import_time("import sqlbag; sqlbag.pg; sqlbag.Base; sqlbag.fan_out")
+
+    # generous, to avoid flakiness: in practice it's closer to 100x
+    assert lazy * 5 < eager
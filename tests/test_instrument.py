@@ -0,0 +1,212 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import gc
+import io
+import json
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+from common import db  # flake8: noqa
+from sqlbag import S, configure_session_cache, get_engine
+from sqlbag.instrument import (
+    INSTRUMENTED,
+    STATEMENT_STATS,
+    SlowQueryLog,
+    _after_cursor_execute,
+    disable_instrumentation,
+    disable_slow_query_log,
+    enable_instrumentation,
+    enable_slow_query_log,
+    instrument_engine,
+    normalize_statement,
+)
+from sqlbag.sqla import ENGINE_HOOKS
+
+
+def test_normalize_statement():
+    assert (
+        normalize_statement("select *\n  from t where a = 'x''y' and b = 1.5")
+        == "select * from t where a = ? and b = ?"
+    )
+    assert normalize_statement("select t1.a from t1") == "select t1.a from t1"
+
+
+def test_instrumentation(db):
+    with S(db) as s:
+        s.execute("create table t(id int)")
+
+    engine = get_engine(db)
+    assert not event.contains(engine, "after_cursor_execute", _after_cursor_execute)
+
+    STATEMENT_STATS.reset()
+    enable_instrumentation()
+
+    try:
+        # already-cached engines are picked up
+        assert event.contains(engine, "after_cursor_execute", _after_cursor_execute)
+
+        with S(db) as s:
+            for i in range(5):
+                s.execute("insert into t values ({})".format(i))
+            s.execute("select * from t").fetchall()
+
+        # as are engines created afterwards
+        with S("sqlite://") as s:
+            s.execute("select 1")
+    finally:
+        disable_instrumentation()
+
+    assert instrument_engine not in ENGINE_HOOKS
+    assert not event.contains(engine, "after_cursor_execute", _after_cursor_execute)
+
+    stats = {_["statement"]: _ for _ in STATEMENT_STATS.dump()}
+
+    inserts = stats["insert into t values (?)"]
+    assert inserts["count"] == 5
+    assert inserts["rows"] == 5
+    assert inserts["p50"] <= inserts["p99"] <= inserts["max"]
+    assert abs(inserts["mean"] * 5 - inserts["total"]) < 1e-9
+
+    assert stats["select * from t"]["count"] == 1
+    assert stats["select ?"]["count"] == 1
+
+    json.dumps(STATEMENT_STATS.dump())
+
+    # nothing recorded once disabled
+    with S(db) as s:
+        s.execute("select * from t").fetchall()
+
+    assert {_["statement"]: _ for _ in STATEMENT_STATS.dump()}[
+        "select * from t"
+    ]["count"] == 1
+
+    STATEMENT_STATS.reset()
+    assert STATEMENT_STATS.dump() == []
+
+
+def test_slow_query_log(db, tmpdir):
+    path = str(tmpdir.join("slow.jsonl"))
+
+    with S(db) as s:
+        s.execute("create table slow(id int)")
+        s.execute("insert into slow select generate_series(1, 10)")
+
+    log = enable_slow_query_log(path, threshold=0.0, analyze=True)
+
+    try:
+        with S(db) as s:
+            s.execute("select * from slow where id > :x", dict(x=5)).fetchall()
+            s.execute("update slow set id = id + 1 where id = 1")
+            s.execute("select * from slow where id = 3 for update").fetchall()
+            s.execute("create table scratch(id int)")
+            s.execute("select * from scratch").fetchall()
+            s.execute("drop table scratch")
+
+        # explaining doesn't need a connection from the engine's pool
+        with S(
+            db, poolclass=QueuePool, pool_size=1, max_overflow=0, pool_timeout=1
+        ) as s:
+            s.execute("select * from slow where id = 4").fetchall()
+
+        with S("sqlite://") as s:
+            s.execute("select 1")
+    finally:
+        disable_slow_query_log()
+
+    assert not log.engines
+
+    with io.open(path) as f:
+        entries = {_["statement"]: _ for _ in map(json.loads, f)}
+
+    select = entries["select * from slow where id > %(x)s"]
+    assert select["parameters"] == {"x": 5}
+    assert select["rowcount"] == 5
+    assert select["duration"] >= 0
+    plan = select["plan"][0]
+    assert plan["Plan"]["Node Type"] == "Seq Scan"
+    assert plan["Plan"]["Actual Rows"] == 5
+
+    # writes are explained but never analyzed
+    update = entries["update slow set id = id + 1 where id = 1"]
+    assert "Actual Rows" not in update["plan"][0]["Plan"]
+    locking = entries["select * from slow where id = 3 for update"]
+    assert "Actual Rows" not in locking["plan"][0]["Plan"]
+
+    assert "plan" in entries["select * from slow where id = 4"]
+
+    with S(db) as s:
+        assert s.execute("select count(*) from slow where id = 2").scalar() == 2
+
+    # the table was gone by the time the statement was explained
+    assert "scratch" in entries["select * from scratch"]["explain_error"]
+
+    assert "plan" not in entries["select 1"]
+    assert "explain_error" not in entries["select 1"]
+
+
+def test_slow_query_log_rotation(tmpdir):
+    path = str(tmpdir.join("slow.jsonl"))
+
+    enable_slow_query_log(path, threshold=0.0, max_bytes=500, backup_count=2)
+
+    try:
+        with S("sqlite://") as s:
+            for i in range(50):
+                s.execute("select {}".format(i))
+    finally:
+        disable_slow_query_log()
+
+    assert sorted(_.basename for _ in tmpdir.listdir()) == [
+        "slow.jsonl",
+        "slow.jsonl.1",
+        "slow.jsonl.2",
+    ]
+
+
+def test_instrumentation_doesnt_keep_engines(tmpdir):
+    configure_session_cache(maxsize=2)
+    enable_instrumentation()
+    log = enable_slow_query_log(str(tmpdir.join("slow.jsonl")))
+
+    try:
+        for i in range(20):
+            url = "sqlite:///{}".format(tmpdir.join("{}.db".format(i)))
+
+            with S(url) as s:
+                s.execute("select 1")
+
+        gc.collect()
+        assert len(INSTRUMENTED) <= 2
+        assert len(log.engines) <= 2
+    finally:
+        disable_slow_query_log()
+        disable_instrumentation()
+        configure_session_cache()
+        STATEMENT_STATS.reset()
+
+
+def test_slow_query_log_queue(tmpdir):
+    log = SlowQueryLog(str(tmpdir.join("slow.jsonl")), threshold=0.0, queue_size=1)
+
+    release = threading.Event()
+    written = []
+
+    def write(entry):
+        release.wait()
+        written.append(entry)
+
+    # hold up the background thread, so statements back up behind it
+    log.write = write
+    engine = create_engine("sqlite://")
+    log.attach(engine)
+
+    for _ in range(5):
+        engine.execute("select 1")
+
+    release.set()
+    log.close()
+
+    assert log.dropped in (3, 4)
+    assert len(written) + log.dropped == 5
@@ -1,21 +1,28 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import gzip
 import io
+import time
+from contextlib import closing
 from datetime import datetime, timedelta, tzinfo
 
 import pendulum
+import psycopg2
 from dateutil.relativedelta import relativedelta
 from pytest import raises
 from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.pool import NullPool
 
 from common import db  # flake8: noqa
-from sqlbag import DB_ERROR_TUPLE, S, copy_url, raw_connection
+from sqlbag import DB_ERROR_TUPLE, S, copy_url, raw_connection, raw_execute
 from sqlbag.pg import (
+    copy_in,
+    copy_out,
     errorcode_from_error,
     pg_errorname_lookup,
     pg_notices,
     pg_print_notices,
+    retrying_transaction,
     use_pendulum_for_time_types,
 )
 from sqlbag.pg.datetimes import (
@@ -209,3 +216,220 @@ def test_pendulum_for_time_types(db):
 
         out = list(result)[0]
         assert list(out) == [None, None, None, None, None]
+
+
+def test_copy_in(db):
+    t = pendulum.parse("2017-12-31 23:34:45", tz="Australia/Melbourne")
+
+    with S(db) as s:
+        s.execute(
+            """
+            create table copied(
+                id serial,
+                name text,
+                tstz timestamptz,
+                d date,
+                i interval,
+                flag boolean,
+                data jsonb,
+                tags text[],
+                raw bytea)
+        """
+        )
+
+        rows = [
+            (
+                1,
+                "tab\there",
+                t,
+                t.date(),
+                relativedelta(days=1, hours=2),
+                True,
+                {"a": [1]},
+                ["x", 'q"uote', None],
+                b"\x00\x01",
+            ),
+            (
+                2,
+                "back\\slash\nnewline",
+                None,
+                None,
+                relativedelta(),
+                False,
+                None,
+                [],
+                None,
+            ),
+        ]
+
+        assert copy_in(s, "copied", iter(rows)) == 2
+
+        out = s.execute(
+            """
+            select *, i = interval '1 day 2 hours' as i_ok, i = interval '0' as i_zero
+            from copied order by id
+        """
+        ).fetchall()
+        assert out[0].name == "tab\there"
+        assert out[0].tstz == t
+        assert out[0].d == t.date()
+        assert out[0].i_ok
+        assert out[0].flag is True
+        assert out[0].data == {"a": [1]}
+        assert out[0].tags == ["x", 'q"uote', None]
+        assert bytes(out[0].raw) == b"\x00\x01"
+        assert out[1].name == "back\\slash\nnewline"
+        assert out[1].tstz is None
+        assert out[1].i_zero
+
+        def generated():
+            for i in range(10000):
+                yield dict(name="name {}".format(i), flag=i % 2 == 0)
+
+        assert copy_in(s, "public.copied", generated(), size=1024) == 10000
+        assert copy_in(s, "copied", []) == 0
+
+        count = s.execute("select count(*) from copied where flag").scalar()
+        assert count == 5001
+
+
+def test_copy_out(db, tmpdir):
+    with S(db) as s:
+        s.execute("create table exported(id int, name text)")
+        copy_in(s, "exported", ((i, "n\t{}".format(i)) for i in range(1000)))
+
+        out = io.BytesIO()
+        assert copy_out(s, "exported", out, header=True) == 1000
+        lines = out.getvalue().decode("utf-8").splitlines()
+        assert lines[:2] == ["id,name", "0,n\t0"]
+
+        out = io.BytesIO()
+        copy_out(s, "select * from exported where id < 2;", out, format="text")
+        assert out.getvalue() == b"0\tn\\t0\n1\tn\\t1\n"
+
+        path = str(tmpdir / "exported.csv.gz")
+        assert copy_out(s, "public.exported", path) == 1000
+
+        with gzip.open(path) as f:
+            assert len(f.read().splitlines()) == 1000
+
+        chunks = list(copy_out(s, "exported", size=1000))
+        assert len(chunks) > 1
+        assert b"".join(chunks).count(b"\n") == 1000
+
+        binary = b"".join(copy_out(s, "exported", format="binary"))
+        assert binary.startswith(b"PGCOPY\n")
+
+        with closing(copy_out(s, "exported", size=10)) as chunks:
+            next(chunks)
+
+        assert s.execute("select count(*) from exported").scalar() == 1000
+
+        # stopping early cancels the query, rather than letting it finish
+        s.execute("insert into exported values (1000, 'kept')")
+        big = "select g, repeat('x', 50) from generate_series(1, 3000000) g"
+        started = time.time()
+
+        with closing(copy_out(s, big)) as chunks:
+            next(chunks)
+
+        assert time.time() - started < 3
+        assert s.execute("select count(*) from exported").scalar() == 1001
+
+        with raises(ValueError):
+            copy_out(s, "exported", format="xml")
+
+    with raises(psycopg2.ProgrammingError):
+        with S(db) as s:
+            list(copy_out(s, "select bad"))
+
+
+def test_retrying_transaction(db):
+    with S(db) as s:
+        s.execute("create table counter(n int)")
+        s.execute("insert into counter values (0)")
+
+    calls = []
+
+    @retrying_transaction(db, isolation_level="SERIALIZABLE", base_delay=0.001)
+    def bump(s):
+        s.execute("select n from counter").scalar()
+
+        if not calls:
+            # a concurrent write after our snapshot was taken
+            with S(db) as s2:
+                s2.execute("update counter set n = n + 1")
+        calls.append(1)
+        s.execute("update counter set n = n + 1")
+        return len(calls)
+
+    assert bump() == 2
+
+    with S(db) as s:
+        assert s.execute("select n from counter").scalar() == 2
+
+    assert bump.retrier.stats() == dict(
+        attempts=2, retries=1, gave_up=0, errors=dict(SERIALIZATION_FAILURE=1)
+    )
+
+    # errors that aren't retryable propagate straight away
+    retrier = retrying_transaction(db)
+
+    with raises(DB_ERROR_TUPLE):
+        for attempt in retrier:
+            with attempt as s:
+                s.execute("select * from nonexistent")
+
+    assert retrier.stats()["attempts"] == 1
+
+    # giving up after max_attempts
+    retrier = retrying_transaction(
+        db, isolation_level="SERIALIZABLE", max_attempts=2, base_delay=0.001
+    )
+
+    with raises(DB_ERROR_TUPLE) as e:
+        for attempt in retrier:
+            with attempt as s:
+                s.execute("select n from counter").scalar()
+
+                with S(db) as s2:
+                    s2.execute("update counter set n = n + 1")
+                s.execute("update counter set n = n + 1")
+
+    assert errorcode_from_error(e.value) == "40001"
+    assert retrier.stats() == dict(
+        attempts=2, retries=1, gave_up=1, errors=dict(SERIALIZATION_FAILURE=1)
+    )
+
+    # and the deadline
+    retrier = retrying_transaction(db, base_delay=10, max_delay=10, deadline=0.001)
+
+    with raises(DB_ERROR_TUPLE):
+        for attempt in retrier:
+            with attempt as s:
+                s.execute("select n from counter").scalar()
+                raise_deadlock(s)
+
+    assert retrier.stats()["gave_up"] == 1
+    assert retrier.stats()["retries"] == 0
+
+    # errors straight from the driver are retried too
+    retrier = retrying_transaction(db, base_delay=0.001)
+
+    for attempt in retrier:
+        with attempt as s:
+            if not retrier.retries:
+                raw_execute(
+                    s,
+                    "do $$ begin raise exception 'x' using errcode = '40001'; end $$",
+                )
+
+    assert retrier.stats() == dict(
+        attempts=2, retries=1, gave_up=0, errors=dict(SERIALIZATION_FAILURE=1)
+    )
+
+
+def raise_deadlock(s):
+    s.execute(
+        "do $$ begin raise exception 'deadlock' using errcode = '40P01'; end $$"
+    )
@@ -0,0 +1,109 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from pytest import raises
+from sqlalchemy import Column, Integer, select
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
+
+from common import db  # flake8: noqa
+from sqlbag import Base as SqlxBase
+from sqlbag import S, alter_url, get_engine, session, temporary_database
+from sqlbag.routing import ReplicaSet, is_read_statement
+from sqlbag.sqla import text
+
+Base = declarative_base(cls=SqlxBase)
+
+
+class Thing(Base):
+    __tablename__ = "thing"
+    id = Column(Integer, primary_key=True)
+
+
+def test_is_read_statement():
+    assert is_read_statement(text("select 1"))
+    assert is_read_statement(text(" (select 1) union (select 2)"))
+    assert not is_read_statement(text("select * from t for update"))
+    assert not is_read_statement(text("select * into t2 from t"))
+    assert not is_read_statement(text("insert into t values (1)"))
+    assert not is_read_statement(text("with x as (delete from t) select 1"))
+    assert is_read_statement(select([Thing.id]))
+    assert not is_read_statement(select([Thing.id]).with_for_update())
+    assert not is_read_statement(Thing.__table__.insert())
+
+
+def test_routing(db):
+    with temporary_database() as r1, temporary_database() as r2:
+        for url in (db, r1, r2):
+            with S(url) as s:
+                Base.metadata.create_all(s.bind.engine)
+
+        def current(s):
+            return s.execute("select current_database()").scalar()
+
+        name = alter_url(db).database
+        names = [alter_url(_).database for _ in (r1, r2)]
+
+        with raises(ValueError):
+            session(db, read_only=True)
+
+        with raises(ValueError):
+            S(db, replicas=[r1], strategy="random").__enter__()
+
+        with S(db, replicas=[r1, r2], read_only=True) as s:
+            first = current(s)
+            # sticks with one replica
+            assert current(s) == first
+            assert s.query(Thing).count() == 0
+
+        with S(db, replicas=[r1, r2], read_only=True) as s:
+            second = current(s)
+
+        # round robin
+        assert sorted([first, second]) == sorted(names)
+
+        # reads go to a replica until the first write
+        with S(db, replicas=[r1, r2]) as s:
+            assert current(s) in names
+            s.add(Thing(id=1))
+            s.flush()
+            assert current(s) == name
+            assert s.query(Thing).count() == 1
+
+        with S(db, replicas=[r1, r2], read_only=False) as s:
+            assert current(s) == name
+
+        replicas = session(db, replicas=[r1, r2]).replica_set
+        assert replicas.primary is get_engine(db)
+        assert sum(replicas.stats()["routed"].values()) == 3
+
+    # replicas that can't be reached are skipped, and then the primary used
+    missing = alter_url(db, database="sqlbag_no_such_database")
+
+    with S(db, replicas=[missing, r1], max_lag=10) as s:
+        assert current(s) == name
+
+    replicas = session(db, replicas=[missing, r1], max_lag=10).replica_set
+    stats = replicas.stats()
+    assert stats["fallbacks"] == 1
+    assert set(stats["lags"].values()) == {None}
+
+    # no replicas at all is just the primary
+    with S(db, replicas=[], read_only=True, max_lag=10) as s:
+        assert current(s) == name
+
+    assert type(session(db, replicas=[])) is type(session(db))
+
+
+def test_least_loaded(tmpdir):
+    a, b = [
+        get_engine("sqlite:///{}".format(tmpdir.join(_)), poolclass=QueuePool)
+        for _ in ("a.db", "b.db")
+    ]
+
+    replicas = ReplicaSet(None, [a, b], strategy="least_loaded")
+
+    with a.connect():
+        assert replicas.choose() is b
+        assert replicas.choose() is b
+
+    assert replicas.lag(a) == 0
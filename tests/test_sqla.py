@@ -2,19 +2,30 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import io
 import os
+import sqlite3
+import threading
+import time
+import tracemalloc
+from contextlib import closing
 
 import psycopg2
 from pytest import raises
 from sqlalchemy import create_engine
 from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.pool import NullPool, QueuePool
 
 from common import db  # flake8: noqa
 from sqlbag import (
+    DB_ERROR_TUPLE,
     C,
     S,
     _killquery,
     admin_db_connection,
+    autocommit_connection,
+    configure_session_cache,
     copy_url,
+    execute_batch,
+    get_engine,
     get_raw_autocommit_connection,
     kill_other_connections,
     load_sql_from_file,
@@ -22,8 +33,10 @@ from sqlbag import (
     raw_connection,
     session,
     sql_from_folder,
+    stream_query,
     temporary_database,
 )
+from sqlbag.sqla import SCOPED_SESSION_MAKERS, get_scoped_session_maker
 
 MYSQL_KILLQUERY_EXPECTED_ALL = """
     select
@@ -135,3 +148,340 @@ def test_transaction_separation(db):
         id1 = s1.execute('select txid_current()').fetchall()[0][0]
         id2 = s2.execute('select txid_current()').fetchall()[0][0]
         assert id1 != id2
+
+
+def test_drain_connections():
+    with temporary_database() as url:
+        name = copy_url(url).database
+        busy = create_engine(url, poolclass=NullPool)
+        # an idle connection, which should be killed straight away
+        idle = create_engine(url, poolclass=NullPool).connect()
+
+        def run_query(seconds):
+            try:
+                busy.execute("select pg_sleep({})".format(seconds))
+            except DB_ERROR_TUPLE:
+                pass
+
+        t = threading.Thread(target=run_query, args=(0.5,))
+        t.start()
+        time.sleep(0.2)
+
+        with admin_db_connection(url) as c:
+            report = kill_other_connections(c, name, drain_timeout=10)
+
+        t.join()
+
+        assert len(report["waited_on"]) == 1
+        assert report["finished"] == report["waited_on"]
+        assert len(report["killed"]) == 1
+        assert report["killed"] != report["waited_on"]
+
+        can_connect = "select has_database_privilege('public', %s, 'connect')"
+
+        # connect is granted back afterwards
+        with admin_db_connection(url) as c:
+            assert c.execute(can_connect, (name,)).scalar() is True
+
+        t = threading.Thread(target=run_query, args=(30,))
+        t.start()
+        time.sleep(0.2)
+
+        with admin_db_connection(url) as c:
+            report = kill_other_connections(
+                c, name, drain_timeout=0.3, keep_closed=True
+            )
+
+        t.join()
+
+        assert report["finished"] == []
+        assert report["killed"] == report["waited_on"]
+        assert report["elapsed"] < 30
+
+        # unless asked not to
+        with admin_db_connection(url) as c:
+            assert c.execute(can_connect, (name,)).scalar() is False
+
+        idle.invalidate()
+        idle.close()
+
+
+def test_session_cache(tmpdir):
+    urls = ["sqlite:///" + str(tmpdir / "{}.db".format(i)) for i in range(3)]
+    before = SCOPED_SESSION_MAKERS.stats()
+
+    try:
+        configure_session_cache(maxsize=2)
+
+        engines = []
+
+        for url in urls + urls[-1:]:
+            with S(url, poolclass=QueuePool) as s:
+                s.execute("select 1")
+                engines.append(s.bind)
+
+        stats = SCOPED_SESSION_MAKERS.stats()
+        assert stats["size"] == 2
+        assert stats["hits"] - before["hits"] == 1
+        assert stats["misses"] - before["misses"] == 3
+        assert stats["evictions"] - before["evictions"] >= 1
+        assert engines[0].pool.checkedin() == 0
+        assert engines[2].pool.checkedin() == 1
+
+        configure_session_cache(ttl=0)
+        assert len(SCOPED_SESSION_MAKERS) == 0
+        assert engines[2].pool.checkedin() == 0
+    finally:
+        configure_session_cache()
+
+
+def test_session_scopes():
+    url = "sqlite://"
+    Session = get_scoped_session_maker(url)
+
+    s1, s2 = session(url), session(url)
+    assert s1 is not s2
+
+    t1, t2 = session(url, scope="thread"), session(url, scope="thread")
+    assert t1 is t2 is Session()
+
+    with S(url, scope="thread") as s:
+        assert s is t1
+
+    assert session(url, scope="thread") is not t1
+
+    with raises(ValueError):
+        session(url, scope="bad")
+
+    Session.remove()
+
+    for _ in range(100):
+        with S(url) as s:
+            pass
+        session(url).close()
+
+    assert not Session.registry.has()
+
+
+def test_session_memory_is_flat():
+    # memory regression benchmark: creating sessions must not grow memory.
+    # raise N to a million to run the full benchmark
+    N = 20000
+    url = "sqlite://"
+
+    def make_sessions(n):
+        for _ in range(n):
+            with S(url):
+                pass
+            session(url).close()
+
+    make_sessions(1000)
+
+    tracemalloc.start()
+
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        make_sessions(N)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert after - before < 256 * 1024
+
+
+def test_connection_engine_reuse(db):
+    e = get_engine(db, pool_size=2, max_overflow=1)
+
+    with C(db, pool_size=2, max_overflow=1) as c:
+        assert c.engine is e
+        c.execute("select 1")
+
+    assert e.pool.size() == 2
+    assert e.pool.checkedin() == 1
+
+    with C(db, pool_size=2, max_overflow=1) as c1, C(
+        db, pool_size=2, max_overflow=1
+    ) as c2:
+        assert c1.engine is c2.engine is e
+        assert e.pool.checkedout() == 2
+
+    with S(db) as s:
+        assert s.bind is get_engine(db)
+
+    with C(db) as c:
+        assert c.engine is get_engine(db)
+
+
+def test_stream_query(db):
+    big = "select g from generate_series(1, :n) g"
+
+    with S(db) as s:
+        rows = stream_query(s, big, dict(n=1000), itersize=100)
+        assert [row.g for row in rows] == list(range(1, 1001))
+
+        batches = list(stream_query(s, big, dict(n=250), itersize=100, batches=True))
+        assert [len(b) for b in batches] == [100, 100, 50]
+
+        open_cursors = "select count(*) from pg_cursors"
+
+        with closing(stream_query(s, big, dict(n=1000), itersize=10)) as rows:
+            assert next(rows).g == 1
+            assert s.execute(open_cursors).scalar() == 1
+
+        assert s.execute(open_cursors).scalar() == 0
+
+    with S("sqlite://") as s:
+        rows = stream_query(s, "select 1 as a union all select 2", batches=True)
+        assert [list(b) for b in rows] == [[(1,), (2,)]]
+
+
+def test_execute_batch(db):
+    def rows(n):
+        for i in range(n):
+            yield (i, "name {}".format(i))
+
+    with S(db) as s:
+        s.execute("create table batched(id int, name text)")
+
+        report = execute_batch(
+            s, "insert into batched(id, name) values %s", rows(1050), page_size=100
+        )
+        assert report["rows"] == 1050
+        assert report["pages"] == 11
+        assert report["rows_per_second"] > 0
+
+        report = execute_batch(
+            s,
+            "update batched set name = %(name)s where id = %(id)s",
+            (dict(id=i, name="renamed") for i in range(10)),
+        )
+        assert report["rows"] == 10
+
+        assert s.execute("select count(*) from batched").scalar() == 1050
+        renamed = "select count(*) from batched where name = 'renamed'"
+        assert s.execute(renamed).scalar() == 10
+
+    with S("sqlite://") as s:
+        s.execute("create table batched(id int, name text)")
+
+        report = execute_batch(
+            s, "INSERT INTO batched VALUES %s", rows(250), page_size=100
+        )
+        assert report["pages"] == 3
+
+        execute_batch(s, "update batched set name = ? where id = ?", [("x", 1)])
+
+        assert s.execute("select count(*) from batched").scalar() == 250
+        assert s.execute("select name from batched where id = 1").scalar() == "x"
+
+
+def test_autocommit_connection(db):
+    def pid_and_vacuum(c):
+        cursor = c.cursor()
+        # vacuum refuses to run inside a transaction
+        cursor.execute("vacuum")
+        cursor.execute("select pg_backend_pid()")
+        return cursor.fetchone()[0]
+
+    with autocommit_connection(db) as c:
+        assert c.autocommit
+        first = pid_and_vacuum(c)
+
+    with autocommit_connection(db) as c:
+        assert pid_and_vacuum(c) == first
+
+    # returned to the pool in transactional mode
+    with S(db) as s:
+        assert raw_connection(s).autocommit is False
+
+    # dead connections are replaced on checkout
+    with C(copy_url(db), poolclass=NullPool) as c:
+        c.execute("select pg_terminate_backend(%s)", (first,))
+
+    with autocommit_connection(get_engine(db)) as c:
+        assert pid_and_vacuum(c) != first
+
+    with autocommit_connection("sqlite://") as c:
+        c.execute("vacuum")
+
+
+def test_load_sql_from_folder_incremental(db, tmpdir):
+    folder = tmpdir.mkdir("incremental")
+    folder.mkdir("views")
+
+    folder.join("a.sql").write("create table if not exists inc(a int);")
+    folder.join("views/v.sql").write("create or replace view v as select 1 as x;")
+    folder.join("empty.sql").write("")
+
+    with S(db) as s:
+        results = load_sql_from_folder(s, str(folder), ledger="sql_ledger")
+
+    assert list(results["applied"]) == ["a.sql", "views/v.sql"]
+    assert all(t >= 0 for t in results["applied"].values())
+    assert results["skipped"] == []
+
+    with S(db) as s:
+        results = load_sql_from_folder(s, str(folder), ledger="sql_ledger")
+
+    assert results == dict(applied={}, skipped=["a.sql", "views/v.sql"])
+
+    folder.join("views/v.sql").write("create or replace view v as select 2 as x;")
+    folder.join("b.sql").write("insert into inc values (1);")
+
+    out = io.StringIO()
+
+    with S(db) as s:
+        results = load_sql_from_folder(
+            s, str(folder), ledger="sql_ledger", verbose=True, out=out
+        )
+        assert s.execute("select x from v").scalar() == 2
+
+    assert list(results["applied"]) == ["b.sql", "views/v.sql"]
+    assert results["skipped"] == ["a.sql"]
+    assert "Skipping unchanged" in out.getvalue()
+
+    # a failed load leaves the ledger as it was
+    folder.join("b.sql").write("insert into inc values (2); select * from nonexistent;")
+
+    with raises(psycopg2.ProgrammingError):
+        with S(db) as s:
+            load_sql_from_folder(s, str(folder), ledger="sql_ledger")
+
+    with S(db) as s:
+        assert s.execute("select count(*) from inc").scalar() == 1
+        assert s.execute("select count(*) from sql_ledger").scalar() == 3
+
+    # without a ledger, everything runs every time
+    folder.join("b.sql").write("insert into inc values (2);")
+
+    with S(db) as s:
+        results = load_sql_from_folder(s, str(folder))
+
+    assert list(results["applied"]) == ["a.sql", "b.sql", "views/v.sql"]
+
+
+def test_connection_unhashable_arguments():
+    args = dict(connect_args={"check_same_thread": False})
+
+    with C("sqlite://", **args) as c:
+        assert c.execute("select 1").scalar() == 1
+        assert c.engine is get_engine("sqlite://", **args)
+
+    with autocommit_connection("sqlite://", **args) as c:
+        c.cursor().execute("select 1")
+
+    class Creator(object):
+        # defining __eq__ makes instances unhashable
+        def __eq__(self, other):
+            return self is other
+
+        def __call__(self):
+            return sqlite3.connect(":memory:")
+
+    # arguments that can't be frozen get an uncached engine
+    cached = len(SCOPED_SESSION_MAKERS)
+
+    with C("sqlite://", creator=Creator()) as c:
+        assert c.execute("select 1").scalar() == 1
+
+    assert len(SCOPED_SESSION_MAKERS) == cached
@@ -0,0 +1,103 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import asyncio
+
+from pytest import raises
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from common import db  # flake8: noqa
+from sqlbag import (
+    AC,
+    AS,
+    async_raw_execute,
+    async_session,
+    configure_session_cache,
+    get_async_engine,
+    temporary_database,
+)
+from sqlbag.sqla_async import ASYNC_ENGINES
+
+
+def test_async_pg(db):
+    url = db.replace("postgresql:", "postgresql+asyncpg:", 1)
+
+    async def run():
+        async with AS(url) as s:
+            await async_raw_execute(s, "create table t(id int)")
+            await s.execute(text("insert into t values (1)"))
+
+        with raises(ProgrammingError):
+            async with AC(url) as c:
+                await c.execute(text("insert into t values (2)"))
+                await c.execute(text("select bad"))
+
+        async with AC(url) as c:
+            result = await c.execute(text("select count(*) from t"))
+            assert result.scalar() == 1
+
+        async def count():
+            async with AC(url) as c:
+                await c.execute(text("select pg_sleep(0.1)"))
+                return (await c.execute(text("select count(*) from t"))).scalar()
+
+        assert await asyncio.gather(*[count() for _ in range(5)]) == [1] * 5
+
+        s = async_session(url)
+        await s.execute(text("insert into t values (3)"))
+        await s.rollback()
+        await s.close()
+
+    asyncio.run(run())
+
+
+def test_async_engine_per_loop(db):
+    url = db.replace("postgresql:", "postgresql+asyncpg:", 1)
+    engines = []
+
+    async def run():
+        async with AS(url) as s:
+            assert (await s.execute(text("select 1"))).scalar() == 1
+
+        engines.append(get_async_engine(url))
+
+    # no disposal in between: each loop gets its own engine, which is
+    # disposed of when the loop shuts down
+    asyncio.run(run())
+    asyncio.run(run())
+
+    assert engines[0] is not engines[1]
+    assert len(ASYNC_ENGINES) == 0
+
+    # a loop closed without shutting down has its engine discarded later
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(run())
+    loop.close()
+
+    assert engines[2] in ASYNC_ENGINES.values()
+    asyncio.run(run())
+    assert engines[2] not in ASYNC_ENGINES.values()
+
+
+def test_async_engine_cache():
+    with temporary_database("sqlite") as url:
+        url = url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+
+        async def run():
+            async with AS(url) as s:
+                await s.execute(text("select 1"))
+
+            async with AC(url) as c:
+                await c.execute(text("select 1"))
+
+            assert ASYNC_ENGINES.stats()["size"] >= 1
+
+            configure_session_cache(ttl=0)
+            await asyncio.sleep(0)
+
+            try:
+                assert len(ASYNC_ENGINES) == 0
+            finally:
+                configure_session_cache()
+
+        asyncio.run(run())
@@ -0,0 +1,109 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from common import db  # flake8: noqa
+from sqlbag import DB_ERROR_TUPLE, S, session, temporary_database
+from sqlbag.testing import isolated_transaction, track_writes, written_tables
+
+
+def test_written_tables():
+    assert written_tables("select * from t for update nowait") == []
+    assert written_tables("insert into t(a) values (1)") == [(None, "t")]
+    assert written_tables('UPDATE public."My ""T""" set a = 1') == [
+        ("public", 'My "T"')
+    ]
+    assert written_tables("DELETE FROM Abc", fold_case=True) == [(None, "abc")]
+    assert written_tables(
+        "with x as (delete from a returning *) insert into b select * from x "
+        "on conflict do update set y = 1"
+    ) == [(None, "a"), (None, "b")]
+    assert written_tables(
+        "insert into a values (1); insert into b values (2);update c set x = 1"
+    ) == [(None, "a"), (None, "b"), (None, "c")]
+    assert written_tables("/* cleanup */ delete from a") == [(None, "a")]
+    assert written_tables("-- cleanup\ndelete from a;\n-- more\ndelete from b") == [
+        (None, "a"),
+        (None, "b"),
+    ]
+    assert written_tables("select '; delete from a' -- ; update b set x = 1") == []
+
+
+def test_track_writes(db):
+    with S(db) as s:
+        s.execute("create table parent(id serial primary key)")
+        s.execute("create table child(id serial, p int references parent(id))")
+        s.execute("create table untouched(id int)")
+        s.execute("insert into untouched values (1)")
+
+    with track_writes(db) as tracker:
+        with S(db) as s:
+            s.execute("insert into parent default values")
+            s.execute("insert into child(p) values (1)")
+            s.execute("create temporary table scratch(id int)")
+            s.execute("insert into scratch values (1)")
+
+        assert tracker.tables == {
+            (None, "parent"),
+            (None, "child"),
+            (None, "scratch"),
+        }
+
+    assert not tracker.attached
+
+    with S(db) as s:
+        assert s.execute("select count(*) from parent").scalar() == 0
+        assert s.execute("select count(*) from child").scalar() == 0
+        assert s.execute("select count(*) from untouched").scalar() == 1
+        assert s.execute("insert into parent default values returning id").scalar() == 1
+
+
+def test_track_writes_sqlite():
+    with temporary_database("sqlite") as url:
+        with S(url) as s:
+            s.execute("create table t(id integer primary key autoincrement)")
+
+        tracker = track_writes(url)
+
+        with S(url) as s:
+            s.execute("insert into t default values")
+            s.execute("insert into t default values")
+
+        assert tracker.reset() == [(None, "t")]
+        assert tracker.tables == set()
+
+        with S(url) as s:
+            assert s.execute("select count(*) from t").scalar() == 0
+            s.execute("insert into t default values")
+            assert s.execute("select id from t").scalar() == 1
+
+        assert tracker.reset() == [(None, "t")]
+        tracker.detach()
+
+
+def test_isolated_transaction(db):
+    with S(db) as s:
+        s.execute("create table isolated(id int)")
+
+    with isolated_transaction(db) as c:
+        with S(db) as s:
+            s.execute("insert into isolated values (1)")
+            s.commit()
+            s.execute("insert into isolated values (2)")
+
+        s = session(db)
+        assert s.execute("select count(*) from isolated").scalar() == 2
+        s.execute("insert into isolated values (3)")
+        s.rollback()
+        assert s.execute("select count(*) from isolated").scalar() == 2
+        s.close()
+
+        try:
+            with S(db) as s:
+                s.execute("insert into isolated values (4)")
+                s.execute("select bad")
+        except DB_ERROR_TUPLE:
+            pass
+
+        assert c.execute("select count(*) from isolated").scalar() == 2
+
+    with S(db) as s:
+        assert s.execute("select count(*) from isolated").scalar() == 0